@@ -42,6 +42,8 @@ function App() {
   }, []);
   const [inventory, setInventory] = useState([]);
   const [documents, setDocuments] = useState([]);
+  const [inventoryCursor, setInventoryCursor] = useState(null);
+  const [documentsCursor, setDocumentsCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [newTableName, setNewTableName] = useState('');
@@ -71,60 +73,75 @@ function App() {
     }
   };
 
+  // Listings come back one keyset page at a time; X-Next-Cursor points at the next one
+  const fetchPage = async (path, cursor = null) => {
+    const url = cursor ? `${config.apiUrl}${path}?cursor=${encodeURIComponent(cursor)}` : `${config.apiUrl}${path}`;
+    const response = await fetch(url, {
+      method: 'GET',
+      credentials: 'include',
+      headers: {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+      },
+    });
+    if (!response.ok) return null;
+    const data = await response.json();
+    return {
+      rows: Array.isArray(data) ? data : (data && typeof data === 'object' ? [data] : []),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+    };
+  };
+
+  // Append the next page of a listing on demand
+  const loadMore = async (path, cursor, setRows, setCursor) => {
+    if (!cursor) return;
+    try {
+      const page = await fetchPage(path, cursor);
+      if (page) {
+        setRows((rows) => [...rows, ...page.rows]);
+        setCursor(page.nextCursor);
+      }
+    } catch (loadError) {
+      console.log(`Error loading more from ${path}:`, loadError);
+    }
+  };
+
   const fetchData = async () => {
     setLoading(true);
     setError(null);
     try {
       // Fetch inventory data
       try {
-        const invResponse = await fetch(`${config.apiUrl}/api/inventory`, {
-          method: 'GET',
-          credentials: 'include',
-          headers: {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-          },
-        });
-
-        if (invResponse.ok) {
-          const invData = await invResponse.json();
-          if (invData && typeof invData === 'object') {
-            const inventoryData = Array.isArray(invData) ? invData : [invData];
-            setInventory(inventoryData);
-          }
+        const inventoryPage = await fetchPage('/api/inventory');
+        if (inventoryPage) {
+          setInventory(inventoryPage.rows);
+          setInventoryCursor(inventoryPage.nextCursor);
         } else {
           console.log('No inventory data available');
           setInventory([]);
+          setInventoryCursor(null);
         }
       } catch (invError) {
         console.log('Error fetching inventory:', invError);
         setInventory([]);
+        setInventoryCursor(null);
       }
 
       // Fetch documents data
       try {
-        const docResponse = await fetch(`${config.apiUrl}/api/documents`, {
-          method: 'GET',
-          credentials: 'include',
-          headers: {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-          },
-        });
-
-        if (docResponse.ok) {
-          const docData = await docResponse.json();
-          if (docData && typeof docData === 'object') {
-            const documentsData = Array.isArray(docData) ? docData : [docData];
-            setDocuments(documentsData);
-          }
+        const documentsPage = await fetchPage('/api/documents');
+        if (documentsPage) {
+          setDocuments(documentsPage.rows);
+          setDocumentsCursor(documentsPage.nextCursor);
         } else {
           console.log('No documents data available');
           setDocuments([]);
+          setDocumentsCursor(null);
         }
       } catch (docError) {
         console.log('Error fetching documents:', docError);
         setDocuments([]);
+        setDocumentsCursor(null);
       }
 
     } catch (error) {
@@ -432,7 +449,11 @@ function App() {
                   loading ? (
                     <div className="loading-spinner">Loading inventory...</div>
                   ) : (
-                    <InventoryTable inventory={inventory} />
+                    <InventoryTable
+                      inventory={inventory}
+                      hasMore={Boolean(inventoryCursor)}
+                      onLoadMore={() => loadMore('/api/inventory', inventoryCursor, setInventory, setInventoryCursor)}
+                    />
                   )
                 } 
               />
@@ -452,7 +473,11 @@ function App() {
                   loading ? (
                     <div className="loading-spinner">Loading documents...</div>
                   ) : (
-                    <DocumentsTable documents={documents} />
+                    <DocumentsTable
+                      documents={documents}
+                      hasMore={Boolean(documentsCursor)}
+                      onLoadMore={() => loadMore('/api/documents', documentsCursor, setDocuments, setDocumentsCursor)}
+                    />
                   )
                 } 
               />
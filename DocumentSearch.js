@@ -115,7 +115,7 @@ function DocumentSearch() {
               </p>
               <p className="result-summary">{result.summary}</p>
               <div className="result-metadata">
-                <span>Relevance: {Math.round(result.similarity * 100)}%</span>
+                <span>Relevance: {Math.round(result.rank * 100)}%</span>
               </div>
             </div>
           ))}
@@ -2,7 +2,7 @@ import React, { useState, useMemo } from 'react';
 import config from '../config';
 import './DocumentsTable.css';
 
-function DocumentsTable({ documents }) {
+function DocumentsTable({ documents, hasMore = false, onLoadMore }) {
   const [sortColumn, setSortColumn] = useState(null);
   const [sortDirection, setSortDirection] = useState(null);
   const [filterCategory, setFilterCategory] = useState('');
@@ -187,7 +187,15 @@ function DocumentsTable({ documents }) {
                 <div className="relevant-chunks">
                   <h5>Relevant Excerpt:</h5>
                   <div className="chunk">
-                    <div className="chunk-content">{result.excerpt}</div>
+                    <div className="chunk-content">
+                      {result.excerpt_parts
+                        ? result.excerpt_parts.map((part, partIndex) => (
+                            part.match
+                              ? <mark key={partIndex}>{part.text}</mark>
+                              : <React.Fragment key={partIndex}>{part.text}</React.Fragment>
+                          ))
+                        : result.excerpt}
+                    </div>
                   </div>
                 </div>
               )}
@@ -261,6 +269,11 @@ function DocumentsTable({ documents }) {
 
       <div className="table-footer">
         <p>Total Documents: {filteredDocuments.length}</p>
+        {hasMore && (
+          <button className="load-more-button" onClick={onLoadMore}>
+            Load more
+          </button>
+        )}
       </div>
     </div>
   );
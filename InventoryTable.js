@@ -3,7 +3,7 @@ import config from '../config';
 import './InventoryTable.css';
 import placeholderImage from '../assets/icons/placeholder.png';
 
-function InventoryTable({ inventory }) {
+function InventoryTable({ inventory, hasMore = false, onLoadMore }) {
   const [sortColumn, setSortColumn] = useState(null);
   const [sortDirection, setSortDirection] = useState(null);
   const [filterCategory, setFilterCategory] = useState('');
@@ -155,6 +155,11 @@ function InventoryTable({ inventory }) {
           </tbody>
         </table>
       </div>
+      {hasMore && (
+        <button className="load-more-button" onClick={onLoadMore}>
+          Load more
+        </button>
+      )}
     </div>
   );
 }
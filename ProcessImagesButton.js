@@ -112,7 +112,7 @@ function ProcessImagesButton({ onProcess, isAuthenticated }) {
         setTaskId(response.data.task_id);
         setUploadProgress(100);
         setProcessingStatus('Processing files...');
-        pollProcessingStatus(response.data.task_id);
+        watchProcessingStatus(response.data.task_id);
       } else {
         throw new Error(response.data.message || 'An error occurred during file processing.');
       }
@@ -128,6 +128,63 @@ function ProcessImagesButton({ onProcess, isAuthenticated }) {
     }
   };
 
+  const isTaskFinished = (task) => ['completed', 'completed_with_errors', 'failed'].includes(task.status);
+
+  const handleTaskUpdate = async (task) => {
+    if (task.status === 'completed' || task.status === 'completed_with_errors') {
+      setProcessingProgress(100);
+      setProcessingStatus('Processing complete!');
+      alert('Files processed successfully!');
+      if (onProcess) {
+        await onProcess();
+      }
+      setSelectedFiles(null);
+      document.getElementById('file-upload').value = '';
+      setUploadProgress(0);
+      setProcessingProgress(0);
+      setProcessingStatus('');
+      setIsUploading(false);
+      // Auto-reload the page
+      window.location.reload();
+    } else if (task.status === 'failed') {
+      setErrorMessage('An error occurred during processing.');
+      setIsUploading(false);
+    } else {
+      // Update processing progress and status
+      setProcessingProgress(task.progress);
+      setProcessingStatus(task.message);
+    }
+  };
+
+  // Follow progress over Server-Sent Events, falling back to polling if the stream is unavailable
+  const watchProcessingStatus = (taskID) => {
+    if (typeof EventSource === 'undefined') {
+      pollProcessingStatus(taskID);
+      return;
+    }
+    const source = new EventSource(`${config.apiUrl}/api/tasks/${taskID}/events`, { withCredentials: true });
+    let finished = false;
+
+    source.addEventListener('progress', (event) => {
+      const task = JSON.parse(event.data);
+      if (isTaskFinished(task)) {
+        finished = true;
+        source.close();
+      }
+      handleTaskUpdate(task);
+    });
+    source.addEventListener('end', () => {
+      finished = true;
+      source.close();
+    });
+    source.onerror = () => {
+      source.close();
+      if (!finished) {
+        pollProcessingStatus(taskID);
+      }
+    };
+  };
+
   const pollProcessingStatus = (taskID) => {
     const interval = setInterval(async () => {
       try {
@@ -138,31 +195,10 @@ function ProcessImagesButton({ onProcess, isAuthenticated }) {
           withCredentials: true
         });
 
-        if (statusResponse.data.status === 'completed') {
-          setProcessingProgress(100);
-          setProcessingStatus('Processing complete!');
-          clearInterval(interval);
-          alert('Files processed successfully!');
-          if (onProcess) {
-            await onProcess();
-          }
-          setSelectedFiles(null);
-          document.getElementById('file-upload').value = '';
-          setUploadProgress(0);
-          setProcessingProgress(0);
-          setProcessingStatus('');
-          setIsUploading(false);
-          // Auto-reload the page
-          window.location.reload();
-        } else if (statusResponse.data.status === 'failed') {
-          setErrorMessage('An error occurred during processing.');
+        if (isTaskFinished(statusResponse.data)) {
           clearInterval(interval);
-          setIsUploading(false);
-        } else {
-          // Update processing progress and status
-          setProcessingProgress(statusResponse.data.progress);
-          setProcessingStatus(statusResponse.data.message);
         }
+        await handleTaskUpdate(statusResponse.data);
       } catch (error) {
         console.error('Error getting processing status:', error);
         setErrorMessage('An error occurred while getting processing status.');
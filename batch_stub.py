@@ -0,0 +1,142 @@
+"""File-based stand-in for the OpenAI Files and Batch endpoints.
+
+LocalBatchStore keeps uploaded files, batches and their output files as plain
+files under one directory, and mirrors the shapes the real API returns for
+POST /files, GET /files/{id}/content, POST /batches and GET /batches/{id}.
+A batch moves validating -> in_progress -> completed on successive retrieves,
+answering every request line with a responder function at the last step, so
+the whole submit/poll/ingest flow can run without network access. Like
+extractors.py, this module stays free of app-level imports.
+"""
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+def default_responder(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Chat completion whose message is an empty JSON object"""
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'stub'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': '{}'},
+            'finish_reason': 'stop'
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    }
+
+class LocalBatchStore:
+    """Files and batches stored as JSON under a root directory"""
+    TERMINAL_STATUSES = frozenset(('completed', 'failed', 'expired', 'cancelled'))
+
+    def __init__(self, root: Path, responder: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.root = Path(root)
+        self.responder = responder or default_responder
+
+    def _dir(self, kind: str) -> Path:
+        path = self.root / kind
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _read(self, kind: str, object_id: str) -> Dict[str, Any]:
+        path = self._dir(kind) / f"{object_id}.json"
+        if not path.exists():
+            raise KeyError(f"No such {kind[:-1]}: {object_id}")
+        return json.loads(path.read_text())
+
+    def _write(self, kind: str, obj: Dict[str, Any]) -> Dict[str, Any]:
+        (self._dir(kind) / f"{obj['id']}.json").write_text(json.dumps(obj))
+        return obj
+
+    def _store_file(self, content_path: Path, filename: str, purpose: str) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex}"
+        target = self._dir('files') / f"{file_id}.jsonl"
+        if content_path != target:
+            shutil.copyfile(content_path, target)
+        return self._write('files', {
+            'id': file_id,
+            'object': 'file',
+            'bytes': target.stat().st_size,
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose
+        })
+
+    def create_file(self, path: Path, purpose: str = 'batch') -> Dict[str, Any]:
+        """POST /files"""
+        return self._store_file(Path(path), Path(path).name, purpose)
+
+    def file_content(self, file_id: str) -> bytes:
+        """GET /files/{file_id}/content"""
+        self._read('files', file_id)
+        return (self._dir('files') / f"{file_id}.jsonl").read_bytes()
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str = '24h',
+                     metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """POST /batches"""
+        total = sum(1 for line in self.file_content(input_file_id).splitlines() if line.strip())
+        return self._write('batches', {
+            'id': f"batch_{uuid.uuid4().hex}",
+            'object': 'batch',
+            'endpoint': endpoint,
+            'input_file_id': input_file_id,
+            'completion_window': completion_window,
+            'status': 'validating',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': int(time.time()),
+            'completed_at': None,
+            'metadata': metadata or {},
+            'errors': None,
+            'request_counts': {'total': total, 'completed': 0, 'failed': 0}
+        })
+
+    def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        """GET /batches/{batch_id}; each call advances a pending batch one step"""
+        batch = self._read('batches', batch_id)
+        if batch['status'] == 'validating':
+            batch['status'] = 'in_progress'
+        elif batch['status'] == 'in_progress':
+            self._run(batch)
+        return self._write('batches', batch)
+
+    def cancel_batch(self, batch_id: str) -> Dict[str, Any]:
+        """POST /batches/{batch_id}/cancel"""
+        batch = self._read('batches', batch_id)
+        if batch['status'] not in self.TERMINAL_STATUSES:
+            batch['status'] = 'cancelled'
+        return self._write('batches', batch)
+
+    def _run(self, batch: Dict[str, Any]) -> None:
+        """Answer every request line and write the output and error files"""
+        outputs, errors = [], []
+        for line in self.file_content(batch['input_file_id']).decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            record = {'id': f"batch_req_{uuid.uuid4().hex}", 'custom_id': request.get('custom_id')}
+            try:
+                if request.get('url') != batch['endpoint']:
+                    raise ValueError(f"Request url {request.get('url')} does not match batch endpoint")
+                body = self.responder(request.get('body') or {})
+                record.update(response={'status_code': 200, 'request_id': uuid.uuid4().hex, 'body': body}, error=None)
+                outputs.append(record)
+            except Exception as e:
+                record.update(response=None, error={'code': 'stub_error', 'message': str(e)})
+                errors.append(record)
+
+        for key, records in (('output_file_id', outputs), ('error_file_id', errors)):
+            if records:
+                path = self._dir('files') / f"{batch['id']}-{key}.jsonl"
+                path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+                stored = self._store_file(path, path.name, 'batch_output')
+                path.unlink()
+                batch[key] = stored['id']
+        batch['request_counts'].update(completed=len(outputs), failed=len(errors))
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
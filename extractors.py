@@ -0,0 +1,167 @@
+"""Document text extractors.
+
+These functions run inside the extraction process pool, so this module stays
+free of app-level imports (Quart, asyncpg, OpenAI) and is cheap to load in a
+fresh worker process. Each extractor takes a file path and returns a dict with
+``text`` and ``page_count``. Register new formats in EXTRACTORS at import time
+so worker processes see them too.
+"""
+import logging
+import math
+import os
+import re
+import zipfile
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+try:
+    import PyPDF2
+except ImportError:
+    logger.warning("PyPDF2 not installed. PDF processing will be unavailable.")
+    PyPDF2 = None
+
+try:
+    from docx import Document
+except ImportError:
+    logger.warning("python-docx not installed. DOCX processing will be unavailable.")
+    Document = None
+
+# Rough page size used for formats without real pagination
+CHARS_PER_PAGE = 3000
+
+def report_pid(pids: Any) -> None:
+    """Pool initializer: announce this worker's pid, so a recycled pool's workers can be found"""
+    pids.put(os.getpid())
+
+def estimate_page_count(text: str) -> int:
+    """Approximate page count for formats that don't store one"""
+    return max(1, math.ceil(len(text) / CHARS_PER_PAGE)) if text else 0
+
+def pdf_page_count(path: str) -> int:
+    """Number of pages in a PDF"""
+    if PyPDF2 is None:
+        raise ValueError("PDF processing is unavailable")
+    return len(PyPDF2.PdfReader(path).pages)
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end) of a PDF"""
+    if PyPDF2 is None:
+        raise ValueError("PDF processing is unavailable")
+    reader = PyPDF2.PdfReader(path)
+    return [(reader.pages[i].extract_text() or '') for i in range(start, min(end, len(reader.pages)))]
+
+def extract_pdf(path: str) -> Dict[str, Any]:
+    """Extract all pages of a PDF"""
+    if PyPDF2 is None:
+        raise ValueError("PDF processing is unavailable")
+    reader = PyPDF2.PdfReader(path)
+    pages = [(page.extract_text() or '') for page in reader.pages]
+    return {'text': "\n".join(pages), 'page_count': len(pages)}
+
+def extract_docx(path: str) -> Dict[str, Any]:
+    """Extract paragraphs of a DOCX, using the page count Word stored if present"""
+    if Document is None:
+        raise ValueError("DOCX processing is unavailable")
+    doc_obj = Document(path)
+    text = "\n".join(paragraph.text for paragraph in doc_obj.paragraphs)
+
+    page_count = None
+    try:
+        with zipfile.ZipFile(path) as archive:
+            app_xml = archive.read('docProps/app.xml').decode('utf-8', errors='ignore')
+        if match := re.search(r'<Pages>(\d+)</Pages>', app_xml):
+            page_count = int(match.group(1))
+    except (KeyError, zipfile.BadZipFile):
+        pass
+    return {'text': text, 'page_count': page_count or estimate_page_count(text)}
+
+def extract_txt(path: str) -> Dict[str, Any]:
+    """Read a plain text file"""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+    return {'text': text, 'page_count': estimate_page_count(text)}
+
+RTF_PATTERN = re.compile(
+    r"\\([a-z]{1,32})(-?\d{1,10})?[ ]?|\\'([0-9a-f]{2})|\\([^a-z])|([{}])|[\r\n]+|(.)",
+    re.IGNORECASE | re.DOTALL
+)
+
+# Groups whose content is formatting data rather than document text
+RTF_DESTINATIONS = frozenset((
+    'author', 'bkmkend', 'bkmkstart', 'colorschememapping', 'colortbl', 'comment',
+    'datastore', 'doccomm', 'fldinst', 'fonttbl', 'footer', 'footerf', 'footerl',
+    'footerr', 'footnote', 'generator', 'header', 'headerf', 'headerl', 'headerr',
+    'info', 'latentstyles', 'listoverridetable', 'listtable', 'object', 'operator',
+    'pict', 'revtbl', 'rsidtbl', 'stylesheet', 'themedata', 'title', 'xmlnstbl'
+))
+
+RTF_SPECIAL_CHARS = {
+    'par': '\n', 'sect': '\n\n', 'page': '\n\n', 'line': '\n', 'tab': '\t',
+    'emdash': '\u2014', 'endash': '\u2013', 'emspace': '\u2003', 'enspace': '\u2002',
+    'bullet': '\u2022', 'lquote': '\u2018', 'rquote': '\u2019',
+    'ldblquote': '\u201c', 'rdblquote': '\u201d'
+}
+
+def rtf_to_text(rtf: str) -> str:
+    """Strip RTF control words and groups, keeping the visible text"""
+    stack = []
+    ignorable = False
+    ucskip = 1
+    curskip = 0
+    out = []
+    for match in RTF_PATTERN.finditer(rtf):
+        word, arg, hex_code, char, brace, tchar = match.groups()
+        if brace:
+            curskip = 0
+            if brace == '{':
+                stack.append((ucskip, ignorable))
+            elif stack:
+                ucskip, ignorable = stack.pop()
+        elif char:
+            curskip = 0
+            if char == '*':
+                ignorable = True
+            elif not ignorable:
+                if char == '~':
+                    out.append('\xa0')
+                elif char in '{}\\':
+                    out.append(char)
+        elif word:
+            curskip = 0
+            if word in RTF_DESTINATIONS:
+                ignorable = True
+            elif ignorable:
+                continue
+            elif word in RTF_SPECIAL_CHARS:
+                out.append(RTF_SPECIAL_CHARS[word])
+            elif word == 'uc':
+                ucskip = int(arg or 1)
+            elif word == 'u' and arg:
+                code = int(arg)
+                out.append(chr(code + 0x10000 if code < 0 else code))
+                curskip = ucskip
+        elif hex_code:
+            if curskip > 0:
+                curskip -= 1
+            elif not ignorable:
+                out.append(bytes([int(hex_code, 16)]).decode('cp1252', errors='replace'))
+        elif tchar:
+            if curskip > 0:
+                curskip -= 1
+            elif not ignorable:
+                out.append(tchar)
+    return ''.join(out)
+
+def extract_rtf(path: str) -> Dict[str, Any]:
+    """Extract visible text from an RTF file"""
+    with open(path, 'r', encoding='latin-1') as f:
+        text = rtf_to_text(f.read())
+    return {'text': text, 'page_count': estimate_page_count(text)}
+
+EXTRACTORS: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    'pdf': extract_pdf,
+    'docx': extract_docx,
+    'txt': extract_txt,
+    'rtf': extract_rtf
+}
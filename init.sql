@@ -27,3 +27,46 @@ CREATE TABLE IF NOT EXISTS documents (
 CREATE INDEX IF NOT EXISTS documents_embedding_idx ON documents 
 USING ivfflat (content_embedding vector_cosine_ops)
 WITH (lists = 100);
+
+-- The tables below are created by initialize_database in server.py at startup,
+-- which is authoritative and also adds the full-text search column and indexes.
+-- They are mirrored here so the script runs on its own for manual setup.
+
+-- Documents analyzed by the server
+CREATE TABLE IF NOT EXISTS document_vault (
+    id SERIAL PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT,
+    journal_publisher TEXT,
+    publication_year INTEGER,
+    page_length INTEGER,
+    thesis TEXT,
+    issue TEXT,
+    summary TEXT,
+    category TEXT NOT NULL,
+    field TEXT,
+    hashtags TEXT,
+    influenced_by TEXT,
+    file_path TEXT UNIQUE NOT NULL,
+    file_type TEXT NOT NULL,
+    extracted_text TEXT,
+    content_hash TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_analyzed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Chunk-level embeddings of document_vault text for semantic search
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id BIGSERIAL PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES document_vault(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    content_hash TEXT,
+    embedding vector(1536) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (document_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks
+USING hnsw (embedding vector_cosine_ops);
@@ -2,22 +2,34 @@ import asyncio
 import asyncpg
 import aiohttp
 import base64
+import contextvars
+import hashlib
 import io
 import json
 import logging
+import multiprocessing
 import os
 import re
+import socket
+import sqlite3
 import sys
+import tempfile
+import time
+import unicodedata
 from pathlib import Path
 import urllib.parse as urlparse
 import uuid
-from typing import Dict, List, Optional, Any, Tuple
-from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple, Callable, Awaitable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, closing, suppress
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
-from PIL import Image
-from quart import Quart, jsonify, request, send_file, make_response
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from PIL import Image, ImageOps
+from quart import Quart, Response, jsonify, request, send_file, make_response, websocket
 from quart_cors import cors
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 # Configure logging
 logging.basicConfig(
@@ -30,21 +42,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+except ImportError:
+    logger.warning("numpy not installed. Semantic search needs pgvector.")
+    np = None
+
 # Set project root directory
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(ROOT_DIR)
 
-try:
-    import PyPDF2
-except ImportError:
-    logger.warning("PyPDF2 not installed. PDF processing will be unavailable.")
-    PyPDF2 = None
-
-try:
-    from docx import Document
-except ImportError:
-    logger.warning("python-docx not installed. DOCX processing will be unavailable.")
-    Document = None
+import batch_stub
+import extractors
 
 def load_env_variables():
     """Load environment variables from .env file."""
@@ -60,7 +69,8 @@ PATHS = {
     'UPLOADS_DIR': DATA_DIR / 'uploads',
     'INVENTORY_IMAGES_DIR': DATA_DIR / 'images' / 'inventory',
     'EXPORTS_DIR': DATA_DIR / 'exports',
-    'DOCUMENT_DIRECTORY': DATA_DIR / 'documents'
+    'DOCUMENT_DIRECTORY': DATA_DIR / 'documents',
+    'BATCH_DIR': DATA_DIR / 'batches'
 }
 
 for directory in PATHS.values():
@@ -143,40 +153,298 @@ class TableManager:
             logger.error(f"Error getting table schema: {e}")
             return []
 
+class TaskStoreConfig:
+    """Where task state lives and how often it is written"""
+    # 'postgres' shares tasks across workers and restarts, 'sqlite' across workers on one node,
+    # 'memory' keeps them in this process only
+    BACKEND = os.getenv('TASK_STORE', 'postgres')
+    SQLITE_PATH = Path(os.getenv('TASK_STORE_SQLITE_PATH', str(DATA_DIR / 'tasks.sqlite3')))
+    # Seconds between batched writes of progress updates
+    FLUSH_INTERVAL = float(os.getenv('TASK_FLUSH_INTERVAL', '1.0'))
+    # Seconds a status read for another worker's task is served from memory
+    READ_CACHE_SECONDS = float(os.getenv('TASK_READ_CACHE_SECONDS', '1.0'))
+    # Minimum seconds between two pushed updates of one task; updates in between are merged
+    PUSH_MIN_INTERVAL = float(os.getenv('TASK_PUSH_MIN_INTERVAL', '0.25'))
+    # Seconds between store reads when watching a task another worker runs
+    PUSH_POLL_INTERVAL = float(os.getenv('TASK_PUSH_POLL_INTERVAL', '1.0'))
+    # Seconds of silence before a watcher is sent a keep-alive
+    PUSH_HEARTBEAT = float(os.getenv('TASK_PUSH_HEARTBEAT', '15'))
+    TERMINAL_STATUSES = frozenset(('completed', 'completed_with_errors', 'failed'))
+
+class MemoryTaskStore:
+    """Task state kept in this process only, invisible to other workers"""
+    def __init__(self):
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+
+    async def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        state = self.tasks.get(task_id)
+        return dict(state) if state is not None else None
+
+    async def save_many(self, tasks: Dict[str, Dict[str, Any]]) -> None:
+        self.tasks.update({task_id: dict(state) for task_id, state in tasks.items()})
+
+    async def delete_expired(self, ttl_seconds: int) -> int:
+        cutoff = time.time() - ttl_seconds
+        expired = [task_id for task_id, state in self.tasks.items() if state['created_at'] < cutoff]
+        for task_id in expired:
+            del self.tasks[task_id]
+        return len(expired)
+
+class PostgresTaskStore:
+    """Task state as JSONB rows in the tasks table"""
+    async def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        async with get_db_pool() as pool:
+            state = await pool.fetchval('SELECT state FROM tasks WHERE task_id = $1', task_id)
+        return json.loads(state) if state is not None else None
+
+    async def save_many(self, tasks: Dict[str, Dict[str, Any]]) -> None:
+        async with get_db_pool() as pool:
+            await pool.executemany("""
+                INSERT INTO tasks (task_id, state, created_at, updated_at)
+                VALUES ($1, $2::jsonb, to_timestamp($3), now())
+                ON CONFLICT (task_id) DO UPDATE SET state = EXCLUDED.state, updated_at = now()
+            """, [(task_id, json.dumps(state, default=str), state['created_at']) for task_id, state in tasks.items()])
+
+    async def delete_expired(self, ttl_seconds: int) -> int:
+        async with get_db_pool() as pool:
+            result = await pool.execute(
+                'DELETE FROM tasks WHERE created_at < now() - make_interval(secs => $1)', float(ttl_seconds)
+            )
+        return int(result.split()[-1])
+
+class SQLiteTaskStore:
+    """Task state in a local SQLite file, shared by the workers of one node"""
+    def __init__(self, path: Path):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._initialized = True
+        return conn
+
+    def _load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT state FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save_many(self, tasks: Dict[str, Dict[str, Any]]) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("""
+                INSERT INTO tasks (task_id, state, created_at, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (task_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            """, [(task_id, json.dumps(state, default=str), state['created_at'], now) for task_id, state in tasks.items()])
+
+    def _delete_expired(self, ttl_seconds: int) -> int:
+        with closing(self._connect()) as conn, conn:
+            return conn.execute('DELETE FROM tasks WHERE created_at < ?', (time.time() - ttl_seconds,)).rowcount
+
+    async def load(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._load, task_id)
+
+    async def save_many(self, tasks: Dict[str, Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._save_many, tasks)
+
+    async def delete_expired(self, ttl_seconds: int) -> int:
+        return await asyncio.to_thread(self._delete_expired, ttl_seconds)
+
 class TaskManager:
-    """Manages background tasks with TTL."""
-    def __init__(self, ttl_seconds: int = 86400):
+    """Manages background tasks with TTL.
+    
+    Tasks started by this worker are kept in memory and every update lands
+    there first; changed tasks are written to the shared store in one batch
+    every TASK_FLUSH_INTERVAL seconds, or right away when they finish. Status
+    reads for tasks run by other workers come from the store through a short
+    read cache. watch() pushes a task's updates to any number of listeners.
+    """
+    def __init__(self, ttl_seconds: int = 86400, store: Any = None):
         self.tasks: Dict[str, Dict[str, Any]] = {}
         self.ttl_seconds = ttl_seconds
+        self.store = store or self.create_store()
+        self._dirty: set = set()
+        self._read_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        # task_id -> events of the watchers following it
+        self._watchers: Dict[str, set] = {}
 
-    def add_task(self, task_id: str) -> None:
+    @staticmethod
+    def create_store() -> Any:
+        if TaskStoreConfig.BACKEND == 'postgres':
+            return PostgresTaskStore()
+        if TaskStoreConfig.BACKEND == 'sqlite':
+            return SQLiteTaskStore(TaskStoreConfig.SQLITE_PATH)
+        return MemoryTaskStore()
+
+    async def add_task(self, task_id: str) -> None:
+        """Register a task and write it through, so any worker can report on it at once"""
         self.tasks[task_id] = {
             'status': 'queued',
             'progress': 0,
             'message': 'Task queued',
-            'created_at': asyncio.get_running_loop().time()
+            'created_at': time.time()
+        }
+        try:
+            await self.store.save_many({task_id: dict(self.tasks[task_id])})
+        except Exception as e:
+            logger.error(f"Error saving task {task_id}: {e}")
+            self._dirty.add(task_id)
+
+    async def adopt(self, task_id: str) -> None:
+        """Take ownership of a task created by another process, so this one's updates are saved"""
+        if task_id in self.tasks:
+            return
+        try:
+            task = await self.store.load(task_id)
+        except Exception as e:
+            logger.error(f"Error loading task {task_id}: {e}")
+            task = None
+        self.tasks[task_id] = task or {
+            'status': 'queued',
+            'progress': 0,
+            'message': 'Task queued',
+            'created_at': time.time()
         }
+        self._read_cache.pop(task_id, None)
+
+    async def release(self, task_id: str) -> None:
+        """Save a task and stop owning it; later reads come from the store"""
+        await self.flush()
+        self.tasks.pop(task_id, None)
 
     def update_task(self, task_id: str, **kwargs) -> None:
         if task_id in self.tasks:
             self.tasks[task_id].update(kwargs)
+            self._dirty.add(task_id)
+            for event in self._watchers.get(task_id, ()):
+                event.set()
+            if kwargs.get('status') in TaskStoreConfig.TERMINAL_STATUSES and self._wakeup is not None:
+                self._wakeup.set()
 
-    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+    def _expired(self, task: Dict[str, Any]) -> bool:
+        return time.time() - task['created_at'] > self.ttl_seconds
+
+    async def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
         task = self.tasks.get(task_id)
-        if task and asyncio.get_running_loop().time() - task['created_at'] <= self.ttl_seconds:
+        if task is None:
+            cached = self._read_cache.get(task_id)
+            if cached and time.monotonic() - cached[0] <= TaskStoreConfig.READ_CACHE_SECONDS:
+                task = cached[1]
+            else:
+                try:
+                    task = await self.store.load(task_id)
+                except Exception as e:
+                    logger.error(f"Error loading task {task_id}: {e}")
+                    task = None
+                if task is not None:
+                    self._read_cache[task_id] = (time.monotonic(), task)
+        if task and not self._expired(task):
             return task
         self.tasks.pop(task_id, None)
+        self._read_cache.pop(task_id, None)
         return None
 
-    def cleanup(self) -> None:
+    async def watch(self, task_id: str):
+        """Async iterator over a task's state as it changes, ending once the task finishes.
+        
+        Updates of a task this worker runs wake watchers immediately; tasks run
+        elsewhere are re-read every TASK_PUSH_POLL_INTERVAL through the read
+        cache, which every watcher on this worker shares. Watchers get at most
+        one state per TASK_PUSH_MIN_INTERVAL, always the latest one, and None
+        as a keep-alive after TASK_PUSH_HEARTBEAT seconds without a change.
+        """
+        event = asyncio.Event()
+        self._watchers.setdefault(task_id, set()).add(event)
         try:
-            current_time = asyncio.get_running_loop().time()
-            expired_tasks = [task_id for task_id, task in self.tasks.items()
-                            if current_time - task['created_at'] > self.ttl_seconds]
-            for task_id in expired_tasks:
-                del self.tasks[task_id]
-        except RuntimeError:
-            logger.warning("Task cleanup attempted outside running loop.")
+            last_state, last_sent = None, 0.0
+            while True:
+                task = await self.get_task(task_id)
+                if task is None:
+                    return
+                state = json.dumps(task, default=str, sort_keys=True)
+                now = time.monotonic()
+                if state != last_state:
+                    last_state, last_sent = state, now
+                    yield dict(task)
+                    if task.get('status') in TaskStoreConfig.TERMINAL_STATUSES:
+                        return
+                elif now - last_sent >= TaskStoreConfig.PUSH_HEARTBEAT:
+                    last_sent = now
+                    yield None
+                
+                event.clear()
+                timeout = TaskStoreConfig.PUSH_POLL_INTERVAL if task_id not in self.tasks else TaskStoreConfig.PUSH_HEARTBEAT
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                # Let a burst of updates settle into one push
+                delay = last_sent + TaskStoreConfig.PUSH_MIN_INTERVAL - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        finally:
+            watchers = self._watchers.get(task_id)
+            if watchers is not None:
+                watchers.discard(event)
+                if not watchers:
+                    del self._watchers[task_id]
+
+    async def flush(self) -> None:
+        """Write every task changed since the last flush in one batch"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        batch = {task_id: dict(self.tasks[task_id]) for task_id in dirty if task_id in self.tasks}
+        try:
+            await self.store.save_many(batch)
+        except Exception as e:
+            logger.error(f"Error saving {len(batch)} tasks: {e}")
+            self._dirty |= dirty
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=TaskStoreConfig.FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def cleanup(self) -> None:
+        expired_tasks = [task_id for task_id, task in self.tasks.items() if self._expired(task)]
+        for task_id in expired_tasks:
+            del self.tasks[task_id]
+        self._read_cache.clear()
+        try:
+            await self.store.delete_expired(self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Error deleting expired tasks: {e}")
 
 # Create global managers
 task_manager = TaskManager()
@@ -241,6 +509,10 @@ async def initialize_database(pool: asyncpg.Pool) -> None:
             )
         ''')
 
+        # Hash of the image bytes and the blob ETag, used to skip re-submitted unchanged images
+        await conn.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS content_hash TEXT')
+        await conn.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS source_etag TEXT')
+
         # Create document_vault table with improved schema
         await conn.execute('''
             CREATE TABLE IF NOT EXISTS document_vault (
@@ -271,58 +543,367 @@ async def initialize_database(pool: asyncpg.Pool) -> None:
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)')
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_title ON document_vault(title)')
         await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_category ON document_vault(category)')
-        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_content ON document_vault USING gin(to_tsvector(\'english\', extracted_text))')
 
-async def analyze_document(text: str) -> Dict[str, Any]:
-    """Analyze document text using GPT-4 model."""
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """
-                Analyze this document and provide a JSON object with the following fields:
-                1. "title": Document title (required)
-                2. "author": Author names if available (required)
-                3. "category": Document type (e.g., Research Paper, Technical Report) (required)
-                4. "field": Primary field or subject area (required)
-                5. "publication_year": Publication year as integer if available
-                6. "journal_publisher": Journal or publisher name if available
-                7. "thesis": Clear, concise thesis statement (required)
-                8. "issue": Main question or problem addressed (required)
-                9. "summary": Comprehensive summary in 400 characters or less (required)
-                10. "influenced_by": 1-3 relevant persons, papers, cases, institutions, etc.
-                11. "hashtags": 3-5 relevant keyword tags for categorization
-                
-                Focus on accuracy and conciseness. For required fields, provide best inference if not explicitly stated.
-                Ensure summary is under 400 characters while capturing key points.
-                Provide response in valid JSON format only, no additional text.
-                """},
-                {"role": "user", "content": text}
-            ],
-            max_tokens=1600,
-            temperature=0.2,
-            response_format={"type": "json_object"}
+        # Weighted full-text vector: title, author and tags (A), summary and thesis (B), body (D).
+        # The body is capped so very long documents stay under the tsvector size limit.
+        await conn.execute('''
+            ALTER TABLE document_vault ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(author, '') || ' ' || coalesce(hashtags, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(summary, '') || ' ' || coalesce(thesis, '')), 'B') ||
+                setweight(to_tsvector('english', left(coalesce(extracted_text, ''), 1000000)), 'D')
+            ) STORED
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_search ON document_vault USING gin(search_vector)')
+        # Superseded by idx_document_search
+        await conn.execute('DROP INDEX IF EXISTS idx_document_content')
+
+        # Keyset pagination indexes: every listing sort and filter ends in id
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_material_id ON products(material, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name_id ON products(name, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_retail_price_id ON products(retail_price, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_import_cost_id ON products(import_cost, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_category_price_id ON products(category, retail_price, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_category_id ON document_vault(category, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_title_id ON document_vault(title, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_year_id ON document_vault(publication_year, id)')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_category_year_id ON document_vault(category, publication_year, id)')
+
+        # Hash of normalized extracted text, used to recognise re-uploaded documents
+        await conn.execute('ALTER TABLE document_vault ADD COLUMN IF NOT EXISTS content_hash TEXT')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_content_hash ON document_vault(content_hash)')
+
+        # Create tasks table shared by all workers for background task state
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                state JSONB NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)')
+
+        # Create job queue tables: one row per ingest job and one per file in it
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                instruction TEXT,
+                options JSONB NOT NULL DEFAULT '{}',
+                batches JSONB NOT NULL DEFAULT '{}',
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                locked_by TEXT,
+                locked_until TIMESTAMPTZ,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        await conn.execute("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS batches JSONB NOT NULL DEFAULT '{}'")
+        await conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_claimable ON jobs(created_at)
+            WHERE status IN ('queued', 'running')
+        ''')
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL REFERENCES jobs(job_id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                name TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (job_id, position)
+            )
+        ''')
+        # Checkpoints match items by position through the primary key
+        await conn.execute('DROP INDEX IF EXISTS idx_job_items_url')
+
+        # Create analysis_cache table for reusing model results
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                result JSONB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_namespace ON analysis_cache(namespace, last_used_at)')
+
+        # Trigram indexes for substring and fuzzy metadata search; the extension may need a superuser
+        try:
+            await conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            MetadataSearch.available = True
+        except asyncpg.PostgresError as e:
+            MetadataSearch.available = await conn.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+            )
+            if not MetadataSearch.available:
+                logger.warning(f"pg_trgm unavailable, fuzzy search will fall back to unindexed substring matching: {e}")
+        if MetadataSearch.available:
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin(name gin_trgm_ops)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_products_key_tags_trgm ON products USING gin(key_tags gin_trgm_ops)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_title_trgm ON document_vault USING gin(title gin_trgm_ops)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_author_trgm ON document_vault USING gin(author gin_trgm_ops)')
+
+        # Chunk embeddings for semantic search: pgvector with an HNSW index, or REAL[] for the numpy index
+        try:
+            await conn.execute('CREATE EXTENSION IF NOT EXISTS vector')
+        except asyncpg.PostgresError as e:
+            logger.warning(f"pgvector extension unavailable: {e}")
+        has_pgvector = await conn.fetchval("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'vector')")
+        embedding_type = f'vector({EmbeddingConfig.DIMENSIONS})' if has_pgvector else 'REAL[]'
+        await conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                id BIGSERIAL PRIMARY KEY,
+                document_id INTEGER NOT NULL REFERENCES document_vault(id) ON DELETE CASCADE,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                content_hash TEXT,
+                embedding {embedding_type} NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (document_id, chunk_index)
+            )
+        ''')
+        backend = await embedding_backend(conn)
+        if backend == 'pgvector':
+            try:
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks USING hnsw (embedding vector_cosine_ops)')
+            except asyncpg.PostgresError as e:
+                # pgvector before 0.5 has no HNSW
+                logger.warning(f"HNSW index unavailable, using ivfflat: {e}")
+                await conn.execute('CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)')
+        document_embeddings.configure(backend)
+
+        # Change version per listed table, bumped by a statement trigger on every write
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 1,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        await conn.execute('''
+            CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO table_versions (table_name) VALUES (TG_TABLE_NAME)
+                ON CONFLICT (table_name) DO UPDATE
+                SET version = table_versions.version + 1, updated_at = now();
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table in ('products', 'document_vault', 'document_chunks'):
+            await conn.execute(
+                'INSERT INTO table_versions (table_name) VALUES ($1) ON CONFLICT (table_name) DO NOTHING', table
+            )
+            await conn.execute(f'DROP TRIGGER IF EXISTS trg_{table}_version ON {table}')
+            await conn.execute(f'''
+                CREATE TRIGGER trg_{table}_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+            ''')
+
+async def embedding_backend(conn: asyncpg.Connection) -> str:
+    """'pgvector' or 'numpy', decided by the embedding column type fixed when document_chunks was created"""
+    column_type = await conn.fetchval("""
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = 'document_chunks'::regclass AND attname = 'embedding'
+    """)
+    return 'pgvector' if column_type.startswith('vector') else 'numpy'
+
+async def detect_database_features(pool: asyncpg.Pool) -> bool:
+    """Configure trigram search and the embedding backend from the existing schema, without DDL.
+    
+    For processes that don't run initialize_database, such as worker.py.
+    Returns False while the schema the web process creates is not there yet.
+    """
+    async with pool.acquire() as conn:
+        if await conn.fetchval("SELECT to_regclass('jobs') IS NULL OR to_regclass('document_chunks') IS NULL"):
+            return False
+        MetadataSearch.available = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
         )
-        
-        content = response.choices[0].message.content
-        if isinstance(content, str):
-            return json.loads(content)
-        return content
-    except Exception as e:
-        logger.error(f"Error analyzing document: {e}")
-        return {
-            'title': 'Untitled Document',
-            'author': 'Unknown Author',
-            'category': 'Document',
-            'field': 'General',
-            'publication_year': None,
-            'journal_publisher': None,
-            'thesis': 'Document analysis unavailable',
-            'issue': 'Unable to determine',
-            'summary': 'Document processing error occurred',
-            'influenced_by': [],
-            'hashtags': []
-        }
+        document_embeddings.configure(await embedding_backend(conn))
+    return True
+
+DOCUMENT_MODEL = "gpt-4o-mini"
+# Bump whenever the document analysis prompt changes so cached analyses are not reused
+DOCUMENT_PROMPT_VERSION = "2"
+
+DOCUMENT_ANALYSIS_PROMPT = """
+            Analyze this document and provide a JSON object with the following fields:
+            1. "title": Document title (required)
+            2. "author": Author names if available (required)
+            3. "category": Document type (e.g., Research Paper, Technical Report) (required)
+            4. "field": Primary field or subject area (required)
+            5. "publication_year": Publication year as integer if available
+            6. "journal_publisher": Journal or publisher name if available
+            7. "thesis": Clear, concise thesis statement (required)
+            8. "issue": Main question or problem addressed (required)
+            9. "summary": Comprehensive summary in 400 characters or less (required)
+            10. "influenced_by": 1-3 relevant persons, papers, cases, institutions, etc.
+            11. "hashtags": 3-5 relevant keyword tags for categorization
+            
+            Focus on accuracy and conciseness. For required fields, provide best inference if not explicitly stated.
+            Ensure summary is under 400 characters while capturing key points.
+            Provide response in valid JSON format only, no additional text.
+            """
+
+DOCUMENT_SECTION_PROMPT = """
+            You are reading one section of a longer document. Provide a JSON object with:
+            1. "title": Document title if it appears in this section, otherwise null
+            2. "author": Author names if they appear in this section, otherwise null
+            3. "publication_year": Publication year as integer if stated, otherwise null
+            4. "journal_publisher": Journal or publisher name if stated, otherwise null
+            5. "key_points": Up to 5 short statements of the section's main claims or findings
+            6. "summary": Summary of this section in 600 characters or less
+            7. "references": Persons, papers, cases or institutions the section relies on
+            Provide response in valid JSON format only, no additional text.
+            """
+
+DOCUMENT_REDUCE_NOTE = """
+            The input is not the document itself but JSON notes taken from consecutive
+            sections of one long document, in order. Combine them into a single analysis
+            of the whole document.
+            """
+
+class DocumentAnalysisConfig:
+    """Token budgeting for document analysis"""
+    # Rough characters-per-token ratio used for estimates
+    CHARS_PER_TOKEN = 4
+    # Documents estimated at or under this many tokens are analyzed in one call
+    SINGLE_CALL_MAX_TOKENS = int(os.getenv('DOCUMENT_SINGLE_CALL_MAX_TOKENS', '12000'))
+    CHUNK_TOKENS = int(os.getenv('DOCUMENT_CHUNK_TOKENS', '6000'))
+    # Upper bound on input tokens spent on one document across all chunk calls
+    INPUT_TOKEN_BUDGET = int(os.getenv('DOCUMENT_INPUT_TOKEN_BUDGET', '60000'))
+    MAP_CONCURRENCY = int(os.getenv('DOCUMENT_MAP_CONCURRENCY', '4'))
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of text"""
+    return -(-len(text) // DocumentAnalysisConfig.CHARS_PER_TOKEN)
+
+def chunk_text(text: str, chunk_tokens: int) -> List[str]:
+    """Split text on line boundaries into chunks of roughly chunk_tokens tokens"""
+    limit = max(1, chunk_tokens * DocumentAnalysisConfig.CHARS_PER_TOKEN)
+    chunks, current, size = [], [], 0
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append('\n'.join(current))
+                current, size = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if size + len(line) + 1 > limit and current:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current and any(part.strip() for part in current):
+        chunks.append('\n'.join(current))
+    return chunks
+
+def select_chunks(chunks: List[str], token_budget: int, chunk_tokens: int) -> List[str]:
+    """Evenly sample chunks so their total stays within the token budget, keeping the first and last"""
+    max_chunks = max(1, token_budget // max(1, chunk_tokens))
+    if len(chunks) <= max_chunks:
+        return chunks
+    if max_chunks == 1:
+        return chunks[:1]
+    step = (len(chunks) - 1) / (max_chunks - 1)
+    return [chunks[round(i * step)] for i in range(max_chunks)]
+
+def json_completion_body(model: str, messages: List[Dict[str, Any]], max_tokens: int,
+                         temperature: float = 0.2) -> Dict[str, Any]:
+    """Chat completion parameters for a JSON-mode request"""
+    return {
+        'model': model,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+        'response_format': {"type": "json_object"}
+    }
+
+def document_analysis_messages(text: str) -> List[Dict[str, Any]]:
+    """Messages analyzing a whole document in one request"""
+    return [
+        {"role": "system", "content": DOCUMENT_ANALYSIS_PROMPT},
+        {"role": "user", "content": text}
+    ]
+
+def document_section_messages(index: int, count: int, chunk: str) -> List[Dict[str, Any]]:
+    """Messages taking notes on one section of a long document (map step)"""
+    return [
+        {"role": "system", "content": DOCUMENT_SECTION_PROMPT},
+        {"role": "user", "content": f"Section {index + 1} of {count}:\n\n{chunk}"}
+    ]
+
+def document_reduce_messages(sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Messages combining section notes into the final analysis (reduce step)"""
+    return [
+        {"role": "system", "content": DOCUMENT_ANALYSIS_PROMPT + DOCUMENT_REDUCE_NOTE},
+        {"role": "user", "content": json.dumps(sections)}
+    ]
+
+def document_sections(text: str) -> Optional[List[str]]:
+    """Chunks to map over for a long document, or None if it fits in one request"""
+    if estimate_tokens(text) <= DocumentAnalysisConfig.SINGLE_CALL_MAX_TOKENS:
+        return None
+    chunk_tokens = DocumentAnalysisConfig.CHUNK_TOKENS
+    all_chunks = chunk_text(text, chunk_tokens)
+    chunks = select_chunks(all_chunks, DocumentAnalysisConfig.INPUT_TOKEN_BUDGET, chunk_tokens)
+    logger.info(f"Analyzing long document in {len(chunks)} of {len(all_chunks)} chunks")
+    return chunks
+
+async def request_json_completion(model: str, messages: List[Dict[str, Any]], max_tokens: int,
+                                  temperature: float = 0.2) -> Dict[str, Any]:
+    """Chat completion in JSON mode, parsed into a dict"""
+    prompt_tokens = sum(estimate_tokens(str(message.get('content', ''))) for message in messages)
+    response = await openai_scheduler.chat_completion(
+        prompt_tokens + max_tokens,
+        **json_completion_body(model, messages, max_tokens, temperature)
+    )
+    
+    content = response.choices[0].message.content
+    if isinstance(content, str):
+        return json.loads(content)
+    return content
+
+async def request_document_analysis(text: str) -> Dict[str, Any]:
+    """Analyze document text using GPT-4 model; raises on failure.
+    
+    Documents within DOCUMENT_SINGLE_CALL_MAX_TOKENS go out as one request.
+    Longer ones are split into chunks that are summarized concurrently (map)
+    and then combined into the final fields (reduce).
+    """
+    chunks = document_sections(text)
+    if chunks is None:
+        return await request_json_completion(DOCUMENT_MODEL, document_analysis_messages(text), max_tokens=1600)
+    
+    semaphore = asyncio.Semaphore(max(1, DocumentAnalysisConfig.MAP_CONCURRENCY))
+    
+    async def analyze_section(index: int, chunk: str) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                notes = await request_json_completion(
+                    DOCUMENT_MODEL, document_section_messages(index, len(chunks), chunk), max_tokens=800
+                )
+                return {'section': index + 1, **notes}
+            except Exception as e:
+                logger.warning(f"Section {index + 1}/{len(chunks)} analysis failed: {e}")
+                return None
+    
+    sections = [notes for notes in await asyncio.gather(*(
+        analyze_section(i, chunk) for i, chunk in enumerate(chunks)
+    )) if notes is not None]
+    if not sections:
+        raise Exception("Every document section failed to analyze")
+    
+    return await request_json_completion(DOCUMENT_MODEL, document_reduce_messages(sections), max_tokens=1600)
 
 class FileValidator:
     """File validation and processing utilities"""
@@ -396,50 +977,689 @@ class CORSConfig:
             'allow_headers': list(cls.ALLOWED_HEADERS),
             'allow_credentials': True,
             'max_age': 86400,
-            'expose_headers': ['Content-Type', 'Authorization', 'Content-Length']
+            'expose_headers': ['Content-Type', 'Authorization', 'Content-Length', 'X-Next-Cursor']
         }
 
+class DatabaseConfig:
+    """Connection pool configuration, overridable through the environment"""
+    MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+    MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+    STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+    # Seconds an idle connection may live before the pool closes it
+    MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv('DB_MAX_INACTIVE_CONNECTION_LIFETIME', '300'))
+    # Queries served by a connection before it is recycled
+    MAX_QUERIES = int(os.getenv('DB_MAX_QUERIES', '50000'))
+    COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', '60'))
+    SSL = os.getenv('DB_SSL', 'require')
+
+class DatabasePoolManager:
+    """Owns the application-lifetime PostgreSQL connection pool."""
+    def __init__(self):
+        self.pool: Optional[asyncpg.Pool] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def open(self) -> asyncpg.Pool:
+        """Create the pool once; later calls return the existing pool."""
+        if self.pool is not None:
+            return self.pool
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.pool is None:
+                database_url = os.getenv('DATABASE_URL')
+                if not database_url:
+                    logger.critical("DATABASE_URL environment variable is not set. Terminating application. ")
+                    raise ValueError("DATABASE_URL environment variable is required")
+                url = urlparse.urlparse(database_url)
+                self.pool = await asyncpg.create_pool(
+                    user=url.username,
+                    password=url.password,
+                    database=url.path[1:],
+                    host=url.hostname,
+                    port=url.port,
+                    ssl=DatabaseConfig.SSL or None,
+                    min_size=DatabaseConfig.MIN_SIZE,
+                    max_size=DatabaseConfig.MAX_SIZE,
+                    statement_cache_size=DatabaseConfig.STATEMENT_CACHE_SIZE,
+                    max_inactive_connection_lifetime=DatabaseConfig.MAX_INACTIVE_CONNECTION_LIFETIME,
+                    max_queries=DatabaseConfig.MAX_QUERIES,
+                    command_timeout=DatabaseConfig.COMMAND_TIMEOUT
+                )
+                logger.info(f"Database pool created (min={DatabaseConfig.MIN_SIZE}, max={DatabaseConfig.MAX_SIZE})")
+        return self.pool
+
+    async def warm(self) -> None:
+        """Check out min_size connections at once so startup pays the TLS handshakes."""
+        pool = await self.open()
+
+        async def ping():
+            async with pool.acquire() as conn:
+                await conn.fetchval('SELECT 1')
+
+        await asyncio.gather(*(ping() for _ in range(max(1, DatabaseConfig.MIN_SIZE))))
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await pool.close()
+            logger.info("Database pool closed")
+
+db_pool_manager = DatabasePoolManager()
+
 @asynccontextmanager
 async def get_db_pool():
-    """Create and manage PostgreSQL connection pool."""
-    pool = None
-    try:
-        database_url = os.getenv('DATABASE_URL')
-        if not database_url:
-            logger.critical("DATABASE_URL environment variable is not set. Terminating application. ")
-            raise ValueError("DATABASE_URL environment variable is required")
-        url = urlparse.urlparse(database_url)
-        pool = await asyncpg.create_pool(
-            user=url.username,
-            password=url.password,
-            database=url.path[1:],
-            host=url.hostname,
-            port=url.port,
-            ssl='require',
-            min_size=1,
-            max_size=10
+    """Yield the shared PostgreSQL connection pool."""
+    yield await db_pool_manager.open()
+
+class HTTPClientConfig:
+    """Shared outbound HTTP client settings"""
+    LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))
+    LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '32'))
+    DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))
+    KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))
+    TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '300'))
+    CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+    READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+    # Hard cap on a single streamed download
+    MAX_DOWNLOAD_BYTES = int(os.getenv('HTTP_MAX_DOWNLOAD_BYTES', str(100 * 1024 * 1024)))
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv('HTTP_DOWNLOAD_CHUNK_SIZE', str(64 * 1024)))
+
+class DownloadMetrics:
+    """Running totals for outbound downloads"""
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.ttfb_total = 0.0
+        self.ttfb_max = 0.0
+        self.duration_total = 0.0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def record(self, size: int, ttfb: float, duration: float) -> None:
+        self.requests += 1
+        self.bytes += size
+        self.ttfb_total += ttfb
+        self.ttfb_max = max(self.ttfb_max, ttfb)
+        self.duration_total += duration
+
+    def snapshot(self) -> Dict[str, Any]:
+        completed = max(self.requests, 1)
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'bytes': self.bytes,
+            'avg_ttfb_ms': round(1000 * self.ttfb_total / completed, 2),
+            'max_ttfb_ms': round(1000 * self.ttfb_max, 2),
+            'avg_duration_ms': round(1000 * self.duration_total / completed, 2),
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused
+        }
+
+class HTTPClientManager:
+    """Owns the app-scoped aiohttp session used for blob downloads and token checks."""
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.metrics = DownloadMetrics()
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_create(session, context, params):
+            self.metrics.connections_created += 1
+
+        async def on_reuse(session, context, params):
+            self.metrics.connections_reused += 1
+
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTPClientConfig.LIMIT,
+                limit_per_host=HTTPClientConfig.LIMIT_PER_HOST,
+                ttl_dns_cache=HTTPClientConfig.DNS_CACHE_TTL,
+                use_dns_cache=True,
+                keepalive_timeout=HTTPClientConfig.KEEPALIVE_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=HTTPClientConfig.TOTAL_TIMEOUT,
+                    connect=HTTPClientConfig.CONNECT_TIMEOUT,
+                    sock_read=HTTPClientConfig.READ_TIMEOUT
+                ),
+                trace_configs=[self._trace_config()]
+            )
+        return self._session
+
+    async def fetch_if_changed(self, url: str, etag: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """Download a URL into memory unless it still matches ``etag``, recording size and time-to-first-byte.
+        
+        Returns the body and the response ETag, or None and the ETag when the
+        server answers 304 Not Modified.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        headers = {'If-None-Match': etag} if etag else None
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                ttfb = loop.time() - started
+                if response.status == 304 and etag:
+                    self.metrics.record(0, ttfb, loop.time() - started)
+                    return None, response.headers.get('ETag', etag)
+                if response.status != 200:
+                    raise Exception(f"Failed to fetch {url}: {response.status}")
+                data = await response.read()
+        except Exception:
+            self.metrics.failures += 1
+            raise
+        self.metrics.record(len(data), ttfb, loop.time() - started)
+        return data, response.headers.get('ETag')
+
+    @asynccontextmanager
+    async def download_to_file(self, url: str, suffix: str = '', max_bytes: Optional[int] = None):
+        """Stream a URL into a temporary file under UPLOADS_DIR and yield its path.
+        
+        The size limit is enforced against Content-Length up front and again while
+        streaming, so an oversized body never lands on disk in full. The file is
+        removed when the context exits.
+        """
+        limit = max_bytes or HTTPClientConfig.MAX_DOWNLOAD_BYTES
+        loop = asyncio.get_running_loop()
+        fd, path = tempfile.mkstemp(dir=PATHS['UPLOADS_DIR'], suffix=suffix)
+        try:
+            started = loop.time()
+            size = 0
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    async with self.session.get(url) as response:
+                        ttfb = loop.time() - started
+                        if response.status != 200:
+                            raise Exception(f"Failed to fetch {url}: {response.status}")
+                        if response.content_length and response.content_length > limit:
+                            raise ValueError(f"Download of {response.content_length} bytes exceeds limit of {limit} bytes")
+                        async for chunk in response.content.iter_chunked(HTTPClientConfig.DOWNLOAD_CHUNK_SIZE):
+                            size += len(chunk)
+                            if size > limit:
+                                raise ValueError(f"Download exceeds limit of {limit} bytes")
+                            out.write(chunk)
+            except Exception:
+                self.metrics.failures += 1
+                raise
+            self.metrics.record(size, ttfb, loop.time() - started)
+            yield Path(path)
+        finally:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+http_client = HTTPClientManager()
+
+# Retries are handled by openai_scheduler, so the client itself must not retry
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+
+# Task the current coroutine works for; set by background jobs so model calls can be shared fairly
+current_task_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('current_task_id', default=None)
+
+class OpenAIRateConfig:
+    """Account-wide OpenAI rate limits and retry policy"""
+    REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '500'))
+    TOKENS_PER_MINUTE = int(os.getenv('OPENAI_TOKENS_PER_MINUTE', '200000'))
+    MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '16'))
+    MIN_CONCURRENCY = int(os.getenv('OPENAI_MIN_CONCURRENCY', '1'))
+    MAX_ATTEMPTS = int(os.getenv('OPENAI_MAX_ATTEMPTS', '6'))
+    RETRY_MAX_WAIT = float(os.getenv('OPENAI_RETRY_MAX_WAIT', '60'))
+    # Processes sharing the account (web workers plus worker.py processes); each gets an equal share of the limits
+    PROCESSES = max(1, int(os.getenv('OPENAI_SCHEDULER_PROCESSES', '1')))
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to one minute of capacity"""
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+    
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+    
+    def sync(self, remaining: float) -> None:
+        """Never believe we have more capacity than the API reports"""
+        self._refill()
+        self.level = min(self.level, remaining)
+
+class OpenAIScheduler:
+    """Shared gate for every OpenAI request made by this process.
+    
+    Requests wait for both the requests/min and tokens/min buckets and for a
+    concurrency slot. Waiting requests are grouped by ``current_task_id`` and
+    served round-robin, so one large job cannot starve smaller ones. Concurrency
+    follows AIMD: it halves on a 429 and creeps back up after a run of successes,
+    and the buckets are synced down to the x-ratelimit-remaining-* response
+    headers. Retryable failures are retried by tenacity with jittered backoff.
+    
+    The buckets live in this process only. Each process is budgeted
+    1/OPENAI_SCHEDULER_PROCESSES of the account's requests and tokens per
+    minute, so that setting must count every web and ingest worker process.
+    """
+    RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+    
+    def __init__(self):
+        self.requests = TokenBucket(OpenAIRateConfig.REQUESTS_PER_MINUTE // OpenAIRateConfig.PROCESSES)
+        self.tokens = TokenBucket(OpenAIRateConfig.TOKENS_PER_MINUTE // OpenAIRateConfig.PROCESSES)
+        self.concurrency = max(1, OpenAIRateConfig.MAX_CONCURRENCY // 2)
+        self.active = 0
+        self.paused_until = 0.0
+        self._successes = 0
+        self._waiters: Dict[str, deque] = {}
+        self._order: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.counters = {'requests': 0, 'rate_limited': 0, 'retries': 0, 'failures': 0}
+    
+    def _wake(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+    
+    def _next_waiter(self) -> Optional[Tuple[str, asyncio.Future, int]]:
+        """Oldest live waiter of the next task in round-robin order"""
+        while self._order:
+            key = self._order[0]
+            queue = self._waiters.get(key)
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if queue:
+                future, tokens = queue[0]
+                return key, future, tokens
+            self._order.popleft()
+            self._waiters.pop(key, None)
+        return None
+    
+    async def _dispatch(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.active < self.concurrency and (waiter := self._next_waiter()):
+                key, future, tokens = waiter
+                delay = max(
+                    self.paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens)
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                self._waiters[key].popleft()
+                self._order.rotate(-1)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self.active += 1
+                future.set_result(None)
+    
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        """Hold one admitted request for the duration of the block"""
+        key = current_task_id.get() or 'interactive'
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._waiters:
+            self._waiters[key] = deque()
+            self._order.append(key)
+        self._waiters[key].append((future, estimated_tokens))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.active -= 1
+                self._wake()
+            raise
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._wake()
+    
+    def _observe_headers(self, headers: Any) -> None:
+        try:
+            if (remaining := headers.get('x-ratelimit-remaining-requests')) is not None:
+                self.requests.sync(float(remaining))
+                if (limit := headers.get('x-ratelimit-limit-requests')) and float(remaining) < 0.05 * float(limit):
+                    self.concurrency = max(OpenAIRateConfig.MIN_CONCURRENCY, self.concurrency - 1)
+            if (remaining := headers.get('x-ratelimit-remaining-tokens')) is not None:
+                self.tokens.sync(float(remaining))
+        except (TypeError, ValueError):
+            pass
+    
+    def _on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.concurrency and self.concurrency < OpenAIRateConfig.MAX_CONCURRENCY:
+            self.concurrency += 1
+            self._successes = 0
+    
+    def _on_rate_limited(self, error: RateLimitError) -> None:
+        self.counters['rate_limited'] += 1
+        self.concurrency = max(OpenAIRateConfig.MIN_CONCURRENCY, self.concurrency // 2)
+        self._successes = 0
+        retry_after = 1.0
+        try:
+            retry_after = float(error.response.headers.get('retry-after', retry_after))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+    
+    async def chat_completion(self, estimated_tokens: int, **kwargs) -> Any:
+        """client.chat.completions.create under the shared limits, with retries"""
+        return await self._call(client.chat.completions.with_raw_response.create, estimated_tokens, **kwargs)
+    
+    async def embeddings(self, estimated_tokens: int, **kwargs) -> Any:
+        """client.embeddings.create under the shared limits, with retries"""
+        return await self._call(client.embeddings.with_raw_response.create, estimated_tokens, **kwargs)
+    
+    async def _call(self, create: Callable[..., Any], estimated_tokens: int, **kwargs) -> Any:
+        retrying = AsyncRetrying(
+            retry=retry_if_exception_type(self.RETRYABLE_ERRORS),
+            wait=wait_random_exponential(multiplier=1, max=OpenAIRateConfig.RETRY_MAX_WAIT),
+            stop=stop_after_attempt(max(1, OpenAIRateConfig.MAX_ATTEMPTS)),
+            reraise=True
         )
-        yield pool
-    finally:
-        if pool:
-            await pool.close()
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    if attempt.retry_state.attempt_number > 1:
+                        self.counters['retries'] += 1
+                    async with self.slot(estimated_tokens):
+                        self.counters['requests'] += 1
+                        try:
+                            raw = await create(**kwargs)
+                        except RateLimitError as e:
+                            self._on_rate_limited(e)
+                            raise
+                        self._observe_headers(raw.headers)
+                        self._on_success()
+                        return raw.parse()
+        except Exception:
+            self.counters['failures'] += 1
+            raise
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'queued': {key: len(queue) for key, queue in self._waiters.items() if queue}
+        }
+
+openai_scheduler = OpenAIScheduler()
+
+class BatchConfig:
+    """Settings for mode="batch" jobs run through the OpenAI Batch API"""
+    # 'openai' submits to the Batch API; 'local' uses the file-based stand-in in batch_stub
+    BACKEND = os.getenv('OPENAI_BATCH_BACKEND', 'openai')
+    API_BASE = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+    STUB_DIR = Path(os.getenv('OPENAI_BATCH_STUB_DIR', str(PATHS['BATCH_DIR'] / 'stub')))
+    COMPLETION_WINDOW = os.getenv('OPENAI_BATCH_COMPLETION_WINDOW', '24h')
+    POLL_INTERVAL = float(os.getenv('OPENAI_BATCH_POLL_INTERVAL', '60'))
+    # Per-file limits of the Batch API; larger jobs are split across several batches
+    MAX_REQUESTS_PER_FILE = int(os.getenv('OPENAI_BATCH_MAX_REQUESTS', '50000'))
+    MAX_FILE_BYTES = int(os.getenv('OPENAI_BATCH_MAX_FILE_BYTES', str(190 * 1024 * 1024)))
+    ENDPOINT = '/v1/chat/completions'
+    TERMINAL_STATUSES = frozenset(('completed', 'failed', 'expired', 'cancelled'))
+
+class OpenAIBatchBackend:
+    """Files and Batch endpoints of the OpenAI API over the shared HTTP session"""
+    def _headers(self) -> Dict[str, str]:
+        return {'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+    
+    async def _request(self, method: str, path: str, **kwargs) -> aiohttp.ClientResponse:
+        response = await http_client.session.request(
+            method, f"{BatchConfig.API_BASE}{path}", headers=self._headers(), **kwargs
+        )
+        if response.status >= 400:
+            detail = await response.text()
+            response.release()
+            raise Exception(f"OpenAI {method} {path} failed with {response.status}: {detail[:500]}")
+        return response
+    
+    async def upload_file(self, path: Path) -> str:
+        with open(path, 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field('purpose', 'batch')
+            form.add_field('file', f, filename=path.name, content_type='application/jsonl')
+            async with await self._request('POST', '/files', data=form) as response:
+                return (await response.json())['id']
+    
+    async def create_batch(self, file_id: str, metadata: Dict[str, str]) -> Dict[str, Any]:
+        async with await self._request('POST', '/batches', json={
+            'input_file_id': file_id,
+            'endpoint': BatchConfig.ENDPOINT,
+            'completion_window': BatchConfig.COMPLETION_WINDOW,
+            'metadata': metadata
+        }) as response:
+            return await response.json()
+    
+    async def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        async with await self._request('GET', f'/batches/{batch_id}') as response:
+            return await response.json()
+    
+    async def file_content(self, file_id: str) -> bytes:
+        async with await self._request('GET', f'/files/{file_id}/content') as response:
+            return await response.read()
 
-client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+class LocalBatchBackend:
+    """Same interface as OpenAIBatchBackend, served by batch_stub.LocalBatchStore"""
+    def __init__(self, root: Path):
+        self.store = batch_stub.LocalBatchStore(root)
+    
+    async def upload_file(self, path: Path) -> str:
+        return (await asyncio.to_thread(self.store.create_file, path))['id']
+    
+    async def create_batch(self, file_id: str, metadata: Dict[str, str]) -> Dict[str, Any]:
+        return await asyncio.to_thread(
+            self.store.create_batch, file_id, BatchConfig.ENDPOINT, BatchConfig.COMPLETION_WINDOW, metadata
+        )
+    
+    async def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.store.retrieve_batch, batch_id)
+    
+    async def file_content(self, file_id: str) -> bytes:
+        return await asyncio.to_thread(self.store.file_content, file_id)
+
+batch_backend = LocalBatchBackend(BatchConfig.STUB_DIR) if BatchConfig.BACKEND == 'local' else OpenAIBatchBackend()
+
+class BatchLedger:
+    """Batch ids a queued job has submitted, per stage, kept in jobs.batches.
+    
+    A job resumed after its worker died polls the batches it already paid for
+    instead of submitting the same requests again.
+    """
+    def __init__(self, pool: asyncpg.Pool, job_id: str, batches: Dict[str, List[str]]):
+        self.pool = pool
+        self.job_id = job_id
+        self.batches = batches
+    
+    def submitted(self, stage: str) -> Optional[List[str]]:
+        return self.batches.get(stage)
+    
+    async def record(self, stage: str, batch_ids: List[str]) -> None:
+        self.batches[stage] = batch_ids
+        await self.pool.execute("""
+            UPDATE jobs SET batches = jsonb_set(batches, ARRAY[$2::text], $3::jsonb), updated_at = now()
+            WHERE job_id = $1
+        """, self.job_id, stage, json.dumps(batch_ids))
+
+class BatchJob:
+    """Collects chat completion requests into JSONL files and runs them as batches.
+    
+    add() appends one request line, starting a new file whenever the Batch
+    API's per-file request or size limit would be exceeded. run() uploads and
+    submits every file, polls until all batches finish, and returns each
+    custom_id mapped to (response body, None) or (None, error message).
+    
+    With a ledger, the submitted batch ids are recorded under ``stage``. If the
+    ledger already has batches for that stage, add() only counts requests and
+    run() polls those batches, so custom_ids must be the same on every run.
+    """
+    def __init__(self, task_id: str, backend: Any = None,
+                 ledger: Optional[BatchLedger] = None, stage: str = 'analysis'):
+        self.task_id = task_id
+        self.backend = backend or batch_backend
+        self.ledger = ledger
+        self.stage = stage
+        self.submitted = ledger.submitted(stage) if ledger else None
+        self.files: List[Tuple[Path, int, int]] = []
+        self.count = 0
+        self._handle = None
+    
+    def add(self, custom_id: str, body: Dict[str, Any]) -> None:
+        if self.submitted is not None:
+            self.count += 1
+            return
+        line = (json.dumps({
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': BatchConfig.ENDPOINT,
+            'body': body
+        }) + '\n').encode('utf-8')
+        if (self._handle is None
+                or self.files[-1][1] >= BatchConfig.MAX_REQUESTS_PER_FILE
+                or self.files[-1][2] + len(line) > BatchConfig.MAX_FILE_BYTES):
+            self._open_file()
+        self._handle.write(line)
+        path, requests, size = self.files[-1]
+        self.files[-1] = (path, requests + 1, size + len(line))
+        self.count += 1
+    
+    def _open_file(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+        fd, path = tempfile.mkstemp(dir=PATHS['BATCH_DIR'], prefix=f"{self.task_id}-", suffix='.jsonl')
+        self._handle = os.fdopen(fd, 'wb')
+        self.files.append((Path(path), 0, 0))
+    
+    def discard(self) -> None:
+        """Close and delete the request files"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        for path, _, _ in self.files:
+            path.unlink(missing_ok=True)
+        self.files = []
+    
+    async def run(self, on_progress: Optional[Callable[[int, int, int], None]] = None
+                  ) -> Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """Submit, wait for and collect every batch; on_progress gets (completed, failed, total)"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self.submitted is not None:
+            batch_ids = self.submitted
+            logger.info(f"Resuming {len(batch_ids)} {self.stage} batches already submitted for task {self.task_id}")
+        else:
+            try:
+                batch_ids = []
+                for path, requests, _ in self.files:
+                    file_id = await self.backend.upload_file(path)
+                    batch = await self.backend.create_batch(file_id, {'task_id': self.task_id})
+                    batch_ids.append(batch['id'])
+                    logger.info(f"Submitted batch {batch['id']} with {requests} requests for task {self.task_id}")
+            finally:
+                self.discard()
+            if self.ledger:
+                try:
+                    await self.ledger.record(self.stage, batch_ids)
+                except Exception as e:
+                    logger.error(f"Could not record batches {batch_ids} of task {self.task_id}: {e}")
+        
+        results: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]] = {}
+        pending = set(batch_ids)
+        counts = {batch_id: (0, 0) for batch_id in batch_ids}
+        while pending:
+            for batch_id in sorted(pending):
+                batch = await self.backend.retrieve_batch(batch_id)
+                request_counts = batch.get('request_counts') or {}
+                counts[batch_id] = (request_counts.get('completed', 0), request_counts.get('failed', 0))
+                if batch['status'] in BatchConfig.TERMINAL_STATUSES:
+                    pending.discard(batch_id)
+                    logger.info(f"Batch {batch_id} finished with status {batch['status']}")
+                    await self._collect(batch, results)
+            if on_progress:
+                on_progress(sum(c for c, _ in counts.values()), sum(f for _, f in counts.values()), self.count)
+            if pending:
+                await asyncio.sleep(BatchConfig.POLL_INTERVAL)
+        return results
+    
+    async def _collect(self, batch: Dict[str, Any],
+                       results: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]]) -> None:
+        for key in ('output_file_id', 'error_file_id'):
+            if not batch.get(key):
+                continue
+            content = await self.backend.file_content(batch[key])
+            for line in content.decode('utf-8').splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get('response') or {}
+                if response.get('status_code') == 200 and not record.get('error'):
+                    results[record['custom_id']] = (response.get('body'), None)
+                else:
+                    error = record.get('error') or (response.get('body') or {}).get('error') or {}
+                    results[record['custom_id']] = (None, error.get('message') or f"Request failed with {response.get('status_code')}")
 
 # Initialize Quart app with CORS
 app = Quart(__name__)
-cors(app, allow_origin=CORSConfig.get_origins(), allow_credentials=True)
+cors(app, allow_origin=CORSConfig.get_origins(), allow_credentials=True, expose_headers=['X-Next-Cursor'])
 
 @app.before_serving
 async def startup():
     try:
-        async with get_db_pool() as pool:
-            await initialize_database(pool)
+        pool = await db_pool_manager.open()
+        await db_pool_manager.warm()
+        await initialize_database(pool)
+        task_manager.start()
+        job_queue.start(JobQueueConfig.INLINE_WORKERS)
         logger.info("Application initialized successfully")
     except Exception as e:
         logger.error(f"Startup failed: {e}")
         raise
 
+@app.after_serving
+async def shutdown():
+    """Release the shared connection pool, HTTP client and extraction workers."""
+    await job_queue.close()
+    await task_manager.close()
+    await image_analysis_cache.close()
+    await document_analysis_cache.close()
+    extraction_engine.shutdown()
+    image_preprocessor.shutdown()
+    await http_client.close()
+    await db_pool_manager.close()
+
 @app.after_request
 async def after_request(response):
     """Add security headers and CORS to all responses."""
@@ -476,44 +1696,419 @@ async def before_request():
     if request.method == 'POST' and not content_type.startswith(('application/json', 'multipart/form-data')):
         return jsonify({'error': 'Invalid Content-Type'}), 415
 
-class DocumentAPI:
-    """Document-related API endpoints"""
+class ListingConfig:
+    """Page sizes for the listing endpoints"""
+    DEFAULT_LIMIT = int(os.getenv('LISTING_DEFAULT_LIMIT', '1000'))
+    MAX_LIMIT = int(os.getenv('LISTING_MAX_LIMIT', '1000'))
+    # Rows fetched per round trip by the server-side cursor of streamed listings
+    STREAM_PREFETCH = int(os.getenv('LISTING_STREAM_PREFETCH', '500'))
+    # Encoded bytes gathered before a chunk of a streamed listing is sent
+    STREAM_FLUSH_BYTES = int(os.getenv('LISTING_STREAM_FLUSH_BYTES', str(32 * 1024)))
+    # Encoded pages kept per endpoint and worker for the current table version
+    RESPONSE_CACHE_ENTRIES = int(os.getenv('LISTING_RESPONSE_CACHE_ENTRIES', '32'))
+
+class ListingQuery:
+    """Keyset-paginated, filtered and projected SELECT over one table.
+    
+    Rows are ordered by (sort column, id) and a page continues from a cursor
+    holding the previous page's last sort value and id, so deep pages cost the
+    same index range scan as the first one. With the default id ordering
+    ``after_id`` can be passed instead of the cursor. NULL sort values come
+    last when ascending and first when descending, matching a plain btree
+    scan in either direction.
+    
+    Responses carry an ETag built from the table's row in table_versions and
+    the query string, so revalidation only costs a primary key lookup, and
+    each worker keeps the encoded bytes of recent pages for that version.
+    """
+    def __init__(self, table: str, fields: Dict[str, Optional[Callable[[Any], Any]]],
+                 filters: Dict[str, Tuple[str, str, Callable[[str], Any]]],
+                 sorts: Tuple[str, ...], default_sort: str = '-id'):
+        # fields: output name -> serializer; filters: query param -> (column, operator, parser)
+        self.table = table
+        self.fields = fields
+        self.filters = filters
+        self.sorts = sorts
+        self.default_sort = default_sort
+        # (query string, stream format) -> (table version, body, next cursor)
+        self._responses: OrderedDict = OrderedDict()
     
     @staticmethod
-    async def get_documents():
-        """Get all documents from Document Vault"""
+    def encode_cursor(value: Any, row_id: int) -> str:
+        return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, int]:
+        try:
+            value, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            return value, int(row_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    
+    def parse_fields(self, args: Dict[str, str]) -> List[str]:
+        """Requested output fields; all of them when fields= is absent"""
+        if not args.get('fields'):
+            return list(self.fields)
+        requested = [name.strip() for name in args['fields'].split(',') if name.strip()]
+        unknown = [name for name in requested if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return requested
+    
+    def plan(self, args: Dict[str, str], streaming: bool = False) -> Dict[str, Any]:
+        """SQL, parameters and output fields for a listing request.
+        
+        Streamed listings are unlimited unless limit is given. Raises ValueError
+        for unknown fields, filters or sorts and malformed values.
+        """
+        fields = self.parse_fields(args)
+        
+        sort = args.get('sort') or self.default_sort
+        descending = sort.startswith('-')
+        sort_column = sort.lstrip('-')
+        if sort_column not in self.sorts:
+            raise ValueError(f"Cannot sort by {sort_column}; choose from {', '.join(self.sorts)}")
+        
+        try:
+            limit = int(args['limit']) if args.get('limit') else (None if streaming else ListingConfig.DEFAULT_LIMIT)
+        except ValueError:
+            raise ValueError(f"Invalid limit: {args.get('limit')}")
+        if limit is not None:
+            limit = max(1, limit if streaming else min(limit, ListingConfig.MAX_LIMIT))
+        
+        conditions, params = [], []
+        for name, (column, operator, parse) in self.filters.items():
+            if args.get(name) in (None, ''):
+                continue
+            try:
+                params.append(parse(args[name]))
+            except ValueError:
+                raise ValueError(f"Invalid value for {name}: {args[name]}")
+            conditions.append(f"{column} {operator} ${len(params)}")
+        
+        cursor = args.get('cursor')
+        if not cursor and args.get('after_id'):
+            if sort_column != 'id':
+                raise ValueError("after_id only applies to id ordering; use cursor")
+            cursor = self.encode_cursor(int(args['after_id']), int(args['after_id']))
+        if cursor:
+            value, row_id = self.decode_cursor(cursor)
+            if sort_column == 'id':
+                params.append(row_id)
+                conditions.append(f"id {'<' if descending else '>'} ${len(params)}")
+            elif value is None:
+                params.append(row_id)
+                keyset = f"({sort_column} IS NULL AND id {'<' if descending else '>'} ${len(params)})"
+                conditions.append(f"({keyset} OR {sort_column} IS NOT NULL)" if descending else keyset)
+            else:
+                params.extend((value, row_id))
+                keyset = f"({sort_column}, id) {'<' if descending else '>'} (${len(params) - 1}, ${len(params)})"
+                conditions.append(keyset if descending else f"({keyset} OR {sort_column} IS NULL)")
+        
+        columns = list(dict.fromkeys(['id', sort_column] + fields))
+        direction = 'DESC' if descending else 'ASC'
+        order = 'id ' + direction if sort_column == 'id' else f"{sort_column} {direction}, id {direction}"
+        limit_clause = ''
+        if limit is not None:
+            # One extra row tells whether another page follows
+            params.append(limit if streaming else limit + 1)
+            limit_clause = f"LIMIT ${len(params)}"
+        sql = f"""
+            SELECT {', '.join(columns)}
+            FROM {self.table}
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY {order}
+            {limit_clause}
+        """
+        return {'sql': sql, 'params': params, 'fields': fields, 'sort_column': sort_column, 'limit': limit}
+    
+    def serialize(self, row: asyncpg.Record, fields: List[str]) -> Dict[str, Any]:
+        return {name: self.fields[name](row[name]) if self.fields[name] else row[name] for name in fields}
+    
+    async def fetch_page(self, conn: asyncpg.Connection, args: Dict[str, str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of serialized rows and the cursor of the next page, if any"""
+        plan = self.plan(args)
+        rows = await conn.fetch(plan['sql'], *plan['params'])
+        
+        next_cursor = None
+        if len(rows) > plan['limit']:
+            rows = rows[:plan['limit']]
+            next_cursor = self.encode_cursor(rows[-1][plan['sort_column']], rows[-1]['id'])
+        
+        return [self.serialize(row, plan['fields']) for row in rows], next_cursor
+    
+    @staticmethod
+    def stream_format(args: Dict[str, str], accept: str) -> Optional[str]:
+        """'ndjson', 'json' or None for a buffered response"""
+        stream = (args.get('stream') or '').lower()
+        if stream == 'ndjson' or 'application/x-ndjson' in accept:
+            return 'ndjson'
+        if stream in ('1', 'true', 'json'):
+            return 'json'
+        return None
+    
+    def stream(self, args: Dict[str, str], stream_format: str, label: str) -> Response:
+        """Stream every matching row as NDJSON or as one chunked JSON array.
+        
+        Rows are read through a server-side cursor and encoded one at a time,
+        so memory stays flat however many rows match and the first bytes go
+        out as soon as the first rows arrive.
+        """
+        plan = self.plan(args, streaming=True)
+        ndjson = stream_format == 'ndjson'
+        
+        async def generate():
+            pending, size = ['' if ndjson else '['], 0
+            first = True
+            try:
+                async with get_db_pool() as pool:
+                    async with pool.acquire() as conn:
+                        async with conn.transaction():
+                            async for row in conn.cursor(plan['sql'], *plan['params'],
+                                                         prefetch=ListingConfig.STREAM_PREFETCH):
+                                encoded = json.dumps(self.serialize(row, plan['fields']), default=str)
+                                if ndjson:
+                                    encoded += '\n'
+                                elif not first:
+                                    encoded = ',' + encoded
+                                pending.append(encoded)
+                                size += len(encoded)
+                                if first or size >= ListingConfig.STREAM_FLUSH_BYTES:
+                                    yield ''.join(pending).encode('utf-8')
+                                    pending, size = [], 0
+                                first = False
+            except Exception as e:
+                # Headers are already sent, so the truncated body is the only signal left
+                logger.error(f"Error streaming {label}: {e}")
+                raise
+            if not ndjson:
+                pending.append(']')
+            yield ''.join(pending).encode('utf-8')
+        
+        response = Response(generate(), mimetype='application/x-ndjson' if ndjson else 'application/json')
+        response.timeout = None
+        return response
+    
+    async def table_version(self, conn: asyncpg.Connection) -> Tuple[int, Optional[datetime]]:
+        row = await conn.fetchrow('SELECT version, updated_at FROM table_versions WHERE table_name = $1', self.table)
+        return (row['version'], row['updated_at']) if row else (0, None)
+    
+    def _cache_response(self, key: Tuple[str, str], version: int, body: bytes, next_cursor: Optional[str]) -> None:
+        self._responses[key] = (version, body, next_cursor)
+        self._responses.move_to_end(key)
+        while len(self._responses) > ListingConfig.RESPONSE_CACHE_ENTRIES:
+            self._responses.popitem(last=False)
+    
+    @staticmethod
+    def _validators(response: Response, etag: str, modified: Optional[datetime]) -> Response:
+        response.set_etag(etag)
+        if modified is not None:
+            response.last_modified = modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    async def respond(self, args: Dict[str, str], label: str):
+        """JSON array response for a listing request, with X-Next-Cursor when more rows follow.
+        
+        With Accept: application/x-ndjson or stream=ndjson the rows are streamed
+        as NDJSON, and with stream=1 as a chunked JSON array. A matching
+        If-None-Match or If-Modified-Since gets a 304 without running the query.
+        """
+        stream_format = self.stream_format(args, request.headers.get('Accept', ''))
+        key = (request.query_string.decode('utf-8', errors='replace'), stream_format or '')
+        
         async with get_db_pool() as pool:
             try:
                 async with pool.acquire() as conn:
-                    rows = await conn.fetch("""
-                        SELECT id, title, author, journal_publisher, publication_year,
-                               page_length, thesis, issue, summary, category, field,
-                               hashtags, influenced_by, file_path, file_type, created_at
-                        FROM document_vault
-                        ORDER BY created_at DESC
-                        LIMIT 1000
-                    """)
+                    version, modified = await self.table_version(conn)
+                    etag = f"{self.table}-{version}-{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]}"
+                    
+                    if request.if_none_match:
+                        not_modified = request.if_none_match.contains(etag)
+                    else:
+                        not_modified = (modified is not None and request.if_modified_since is not None
+                                        and modified.replace(microsecond=0) <= request.if_modified_since)
+                    if not_modified:
+                        return self._validators(Response(status=304), etag, modified)
+                    
+                    if stream_format:
+                        return self._validators(self.stream(args, stream_format, label), etag, modified)
                     
-                    return jsonify([{
-                        'id': row['id'],
-                        'title': row['title'],
-                        'author': row['author'],
-                        'journal_publisher': row['journal_publisher'],
-                        'publication_year': row['publication_year'],
-                        'page_length': row['page_length'],
-                        'thesis': row['thesis'],
-                        'issue': row['issue'],
-                        'summary': row['summary'],
-                        'category': row['category'],
-                        'field': row['field'],
-                        'hashtags': row['hashtags'],
-                        'influenced_by': row['influenced_by'],
-                        'file_type': row['file_type'],
-                        'created_at': row['created_at'].isoformat() if row['created_at'] else None
-                    } for row in rows])
+                    cached = self._responses.get(key)
+                    if cached is not None and cached[0] == version:
+                        self._responses.move_to_end(key)
+                        _, body, next_cursor = cached
+                    else:
+                        items, next_cursor = await self.fetch_page(conn, args)
+                        body = await jsonify(items).get_data()
+                        self._cache_response(key, version, body, next_cursor)
+            except (ValueError, asyncpg.DataError) as e:
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
-                logger.error(f"Error fetching documents: {e}")
-                return jsonify({'error': 'Failed to fetch documents'}), 500
+                logger.error(f"Error fetching {label}: {e}")
+                return jsonify({'error': f'Failed to fetch {label}'}), 500
+        
+        response = self._validators(Response(body, mimetype='application/json'), etag, modified)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+class MetadataSearch:
+    """Substring and fuzzy search over short metadata columns.
+    
+    Both modes are served by pg_trgm GIN indexes: substring mode matches
+    ILIKE '%q%', fuzzy mode matches columns containing a word similar to the
+    query (word_similarity, via the <% operator) and ranks by that score.
+    Without pg_trgm, fuzzy requests degrade to substring matching.
+    """
+    # Set by initialize_database once pg_trgm is known to be installed
+    available = False
+    DEFAULT_THRESHOLD = float(os.getenv('FUZZY_SEARCH_THRESHOLD', '0.4'))
+    MAX_LIMIT = 100
+    
+    def __init__(self, table: str, columns: Tuple[str, ...], fields: Dict[str, Optional[Callable[[Any], Any]]]):
+        # columns are searched; fields are returned, each with an optional serializer
+        self.table = table
+        self.columns = columns
+        self.fields = fields
+    
+    @staticmethod
+    def escape_like(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    
+    async def search(self, conn: asyncpg.Connection, query: str, mode: str, limit: int,
+                     threshold: float) -> Tuple[List[Dict[str, Any]], str]:
+        """Matching rows, best first, and the mode actually used"""
+        if mode == 'fuzzy' and not MetadataSearch.available:
+            mode = 'substring'
+        
+        if mode == 'fuzzy':
+            match = ' OR '.join(f"$1 <% {column}" for column in self.columns)
+            score = f"GREATEST({', '.join(f'word_similarity($1, {column})' for column in self.columns)})"
+            params = [query]
+        else:
+            match = ' OR '.join(f"{column} ILIKE $1" for column in self.columns)
+            # Prefix matches first, then shorter values
+            score = f"GREATEST({', '.join(f'({column} ILIKE $2)::int' for column in self.columns)})"
+            params = [f"%{self.escape_like(query)}%", f"{self.escape_like(query)}%"]
+        params.append(limit)
+        
+        sql = f"""
+            SELECT {', '.join(self.fields)}, {score} AS score
+            FROM {self.table}
+            WHERE {match}
+            ORDER BY score DESC, length({self.columns[0]}), id DESC
+            LIMIT ${len(params)}
+        """
+        async with conn.transaction():
+            if mode == 'fuzzy':
+                await conn.execute("SELECT set_config('pg_trgm.word_similarity_threshold', $1, true)", str(threshold))
+            rows = await conn.fetch(sql, *params)
+        
+        return [{
+            **{name: serialize(row[name]) if serialize else row[name] for name, serialize in self.fields.items()},
+            'score': float(row['score'])
+        } for row in rows], mode
+    
+    async def respond(self, args: Dict[str, str], label: str):
+        """Search endpoint body for q, mode (substring or fuzzy), limit and threshold"""
+        query = (args.get('q') or '').strip()
+        mode = args.get('mode', 'fuzzy')
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+        if mode not in ('substring', 'fuzzy'):
+            return jsonify({'error': "mode must be 'substring' or 'fuzzy'"}), 400
+        try:
+            limit = max(1, min(int(args.get('limit', 20)), MetadataSearch.MAX_LIMIT))
+            threshold = min(max(float(args.get('threshold', MetadataSearch.DEFAULT_THRESHOLD)), 0.0), 1.0)
+        except ValueError:
+            return jsonify({'error': 'limit and threshold must be numbers'}), 400
+        
+        try:
+            async with get_db_pool() as pool:
+                async with pool.acquire() as conn:
+                    results, used_mode = await self.search(conn, query, mode, limit, threshold)
+            return jsonify({'results': results, 'mode': used_mode})
+        except Exception as e:
+            logger.error(f"Error searching {label}: {e}")
+            return jsonify({'error': 'Search failed'}), 500
+
+class DocumentAPI:
+    """Document-related API endpoints"""
+    
+    LISTING = ListingQuery(
+        'document_vault',
+        fields={
+            'id': None, 'title': None, 'author': None, 'journal_publisher': None,
+            'publication_year': None, 'page_length': None, 'thesis': None, 'issue': None,
+            'summary': None, 'category': None, 'field': None, 'hashtags': None,
+            'influenced_by': None, 'file_type': None,
+            'created_at': lambda value: value.isoformat() if value else None
+        },
+        filters={
+            'category': ('category', '=', str),
+            'field': ('field', '=', str),
+            'file_type': ('file_type', '=', str),
+            'year': ('publication_year', '=', int),
+            'min_year': ('publication_year', '>=', int),
+            'max_year': ('publication_year', '<=', int)
+        },
+        sorts=('id', 'title', 'publication_year')
+    )
+    
+    METADATA_SEARCH = MetadataSearch(
+        'document_vault',
+        columns=('title', 'author'),
+        fields={'id': None, 'title': None, 'author': None, 'category': None, 'publication_year': None}
+    )
+    
+    @staticmethod
+    async def get_documents():
+        """List documents from Document Vault.
+        
+        Query parameters: limit, cursor or after_id, fields (comma separated),
+        sort (id, title or publication_year; prefix with - for descending) and
+        the filters category, field, file_type, year, min_year and max_year.
+        The next page's cursor is returned in the X-Next-Cursor header.
+        stream=1 or Accept: application/x-ndjson streams every match instead.
+        """
+        return await DocumentAPI.LISTING.respond(request.args, 'documents')
+    
+    @staticmethod
+    async def search_metadata():
+        """Substring or fuzzy search over document titles and authors.
+        
+        Query parameters: q, mode (fuzzy, the default, or substring), limit and
+        threshold (minimum word similarity for fuzzy matches).
+        """
+        return await DocumentAPI.METADATA_SEARCH.respond(request.args, 'document metadata')
+    
+    @staticmethod
+    async def semantic_search():
+        """Nearest-neighbor search over document chunk embeddings.
+        
+        Body: query and k (number of documents, default 10). Each result has
+        the document's metadata, its best matching passage and the cosine
+        similarity of that passage.
+        """
+        try:
+            data = await request.get_json()
+            query = (data.get('query') or '').strip()
+            if not query:
+                return jsonify({'error': 'Search query is required'}), 400
+            try:
+                k = max(1, min(int(data.get('k', 10)), 50))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'k must be an integer'}), 400
+            if document_embeddings.backend is None:
+                return jsonify({'error': 'Semantic search is unavailable'}), 503
+            
+            async with get_db_pool() as pool:
+                results = await document_embeddings.search(pool, query, k)
+            return jsonify({'results': results})
+        except Exception as e:
+            logger.error(f"Error in semantic search: {e}")
+            return jsonify({'error': 'Search failed'}), 500
     
     @staticmethod
     async def get_document_text(doc_id: int):
@@ -564,9 +2159,43 @@ class DocumentAPI:
                 logger.error(f"Error serving document file: {e}")
                 return jsonify({'error': 'Failed to serve document file'}), 500
     
+    # ts_filter weight classes searched for each field option
+    SEARCH_WEIGHTS = {'all': None, 'metadata': '{a,b}', 'content': '{d}'}
+    SEARCH_MAX_LIMIT = 100
+    SEARCH_MAX_FRAGMENTS = 5
+    # Characters of body text ts_headline reads per hit, bounding its cost on very long documents
+    HEADLINE_MAX_CHARS = int(os.getenv('SEARCH_HEADLINE_MAX_CHARS', '200000'))
+    HEADLINE_DELIMITER = ' ... '
+    # Control characters ts_headline wraps matches in; they are stripped from the text first
+    HEADLINE_START = '\x02'
+    HEADLINE_STOP = '\x03'
+    
+    @staticmethod
+    def headline_parts(headline: str) -> List[Dict[str, Any]]:
+        """Split a ts_headline result on its match markers into {text, match} segments"""
+        parts, match = [], False
+        for piece in re.split(f'([{DocumentAPI.HEADLINE_START}{DocumentAPI.HEADLINE_STOP}])', headline):
+            if piece in (DocumentAPI.HEADLINE_START, DocumentAPI.HEADLINE_STOP):
+                match = piece == DocumentAPI.HEADLINE_START
+            elif piece:
+                parts.append({'text': piece, 'match': match})
+        return parts
+    
     @staticmethod
     async def search_documents():
-        """Search documents by content or metadata"""
+        """Ranked full-text search over document metadata and content.
+        
+        Body: query, field (all, metadata or content), phrase (match the query
+        as an exact phrase instead of web-search syntax), category, limit,
+        offset and fragments. Results are ordered by ts_rank_cd over the
+        weighted search_vector; next_offset is null on the last page.
+        
+        Highlights come from ts_headline, run only on the returned page.
+        ``excerpt`` is plain text and ``excerpt_parts`` splits it into
+        {text, match} segments for the client to render, so no document text
+        is ever sent as markup. Metadata searches highlight the summary and
+        thesis, other searches the body text.
+        """
         try:
             data = await request.get_json()
             query = data.get('query', '').strip()
@@ -574,95 +2203,130 @@ class DocumentAPI:
             
             if not query:
                 return jsonify({'error': 'Search query is required'}), 400
+            if field not in DocumentAPI.SEARCH_WEIGHTS:
+                return jsonify({'error': f"field must be one of {', '.join(DocumentAPI.SEARCH_WEIGHTS)}"}), 400
+            try:
+                limit = max(1, min(int(data.get('limit', 20)), DocumentAPI.SEARCH_MAX_LIMIT))
+                offset = max(0, int(data.get('offset', 0)))
+                fragments = max(1, min(int(data.get('fragments', 3)), DocumentAPI.SEARCH_MAX_FRAGMENTS))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'limit, offset and fragments must be integers'}), 400
+            
+            to_query = 'phraseto_tsquery' if data.get('phrase') else 'websearch_to_tsquery'
+            params: List[Any] = [query]
+            conditions = ['search_vector @@ q']
+            if weights := DocumentAPI.SEARCH_WEIGHTS[field]:
+                conditions.append(f"ts_filter(search_vector, '{weights}') @@ q")
+            category = data.get('category')
+            if category and category != 'All Categories':
+                params.append(category)
+                conditions.append(f"category = ${len(params)}")
+            params.extend((limit + 1, offset))
+            limit_param, offset_param = len(params) - 1, len(params)
+            
+            if field == 'metadata':
+                highlight_source = "coalesce(d.summary, '') || ' ' || coalesce(d.thesis, '')"
+            else:
+                params.append(DocumentAPI.HEADLINE_MAX_CHARS)
+                highlight_source = f"left(coalesce(d.extracted_text, ''), ${len(params)})"
+            highlight_source = f"translate({highlight_source}, chr(2) || chr(3), '')"
+            params.append(
+                f'MaxFragments={fragments}, MaxWords=35, MinWords=15, '
+                f'StartSel="{DocumentAPI.HEADLINE_START}", StopSel="{DocumentAPI.HEADLINE_STOP}", '
+                f'FragmentDelimiter="{DocumentAPI.HEADLINE_DELIMITER}"'
+            )
             
             async with get_db_pool() as pool:
                 async with pool.acquire() as conn:
-                    if field == 'content':
-                        where_clause = "extracted_text ILIKE $1"
-                    elif field == 'metadata':
-                        where_clause = """
-                            title ILIKE $1 OR author ILIKE $1 OR summary ILIKE $1 
-                            OR thesis ILIKE $1 OR hashtags ILIKE $1
-                        """
-                    else:
-                        where_clause = """
-                            title ILIKE $1 OR author ILIKE $1 OR summary ILIKE $1 
-                            OR thesis ILIKE $1 OR hashtags ILIKE $1 OR extracted_text ILIKE $1
-                        """
-                    
-                    sql = f"""
-                        SELECT id, title, author, summary, extracted_text
-                        FROM document_vault
-                        WHERE {where_clause}
-                        ORDER BY created_at DESC
-                        LIMIT 100
-                    """
-                    
-                    rows = await conn.fetch(sql, f'%{query}%')
+                    rows = await conn.fetch(f"""
+                        WITH hits AS (
+                            SELECT id, ts_rank_cd(search_vector, q, 32) AS rank
+                            FROM document_vault, {to_query}('english', $1) AS q
+                            WHERE {' AND '.join(conditions)}
+                            ORDER BY rank DESC, id DESC
+                            LIMIT ${limit_param} OFFSET ${offset_param}
+                        )
+                        SELECT d.id, d.title, d.author, d.summary, d.category, d.field, hits.rank,
+                               ts_headline('english', {highlight_source}, {to_query}('english', $1),
+                                           ${len(params)}) AS excerpt
+                        FROM hits JOIN document_vault d ON d.id = hits.id
+                        ORDER BY hits.rank DESC, d.id DESC
+                    """, *params)
                     
-                    results = [{
-                        'id': row['id'],
-                        'title': row['title'],
-                        'author': row['author'],
-                        'summary': row['summary'],
-                        'excerpt': extract_matching_excerpt(row['extracted_text'], query)
-                    } for row in rows]
+                    next_offset = offset + limit if len(rows) > limit else None
+                    results = []
+                    for row in rows[:limit]:
+                        parts = DocumentAPI.headline_parts(row['excerpt'] or '')
+                        results.append({
+                            'id': row['id'],
+                            'title': row['title'],
+                            'author': row['author'],
+                            'summary': row['summary'],
+                            'category': row['category'],
+                            'field': row['field'],
+                            'rank': row['rank'],
+                            'excerpt': ''.join(part['text'] for part in parts),
+                            'excerpt_parts': parts
+                        })
                     
-                    return jsonify({'results': results})
+                    return jsonify({'results': results, 'next_offset': next_offset})
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return jsonify({'error': 'Search failed'}), 500
 
-def extract_matching_excerpt(text: str, query: str, context_chars: int = 150) -> str:
-    """Extract a relevant excerpt from text containing the search query"""
-    if not text or not query:
-        return ""
-    
-    query_pos = text.lower().find(query.lower())
-    if query_pos == -1:
-        return text[:300] + "..."
-    
-    start = max(0, query_pos - context_chars)
-    end = min(len(text), query_pos + len(query) + context_chars)
-    
-    excerpt = text[start:end]
-    if start > 0:
-        excerpt = "..." + excerpt
-    if end < len(text):
-        excerpt = excerpt + "..."
-    
-    return excerpt
-
 class InventoryAPI:
     """Inventory-related API endpoints"""
     
+    LISTING = ListingQuery(
+        'products',
+        fields={
+            'id': None, 'name': None, 'description': None,
+            'image_url': lambda value: convert_to_relative_path(value),
+            'category': None, 'material': None, 'color': None, 'dimensions': None,
+            'origin_source': None, 'import_cost': None, 'retail_price': None, 'key_tags': None
+        },
+        filters={
+            'category': ('category', '=', str),
+            'material': ('material', '=', str),
+            'color': ('color', '=', str),
+            'min_price': ('retail_price', '>=', float),
+            'max_price': ('retail_price', '<=', float),
+            'min_cost': ('import_cost', '>=', float),
+            'max_cost': ('import_cost', '<=', float)
+        },
+        sorts=('id', 'name', 'retail_price', 'import_cost')
+    )
+    
+    SEARCH = MetadataSearch(
+        'products',
+        columns=('name', 'key_tags'),
+        fields={
+            'id': None, 'name': None, 'category': None, 'key_tags': None, 'retail_price': None,
+            'image_url': lambda value: convert_to_relative_path(value)
+        }
+    )
+    
     @staticmethod
     async def get_inventory():
-        """Get all inventory items"""
-        async with get_db_pool() as pool:
-            try:
-                async with pool.acquire() as conn:
-                    rows = await conn.fetch("SELECT * FROM products ORDER BY id DESC LIMIT 1000")
-                    
-                    inventory = [{
-                        'id': row['id'],
-                        'name': row['name'],
-                        'description': row['description'],
-                        'image_url': convert_to_relative_path(row['image_url']),
-                        'category': row['category'],
-                        'material': row['material'],
-                        'color': row['color'],
-                        'dimensions': row['dimensions'],
-                        'origin_source': row['origin_source'],
-                        'import_cost': row['import_cost'],
-                        'retail_price': row['retail_price'],
-                        'key_tags': row['key_tags']
-                    } for row in rows]
-                    
-                    return jsonify(inventory)
-            except Exception as e:
-                logger.error(f"Error fetching inventory: {e}")
-                return jsonify({'error': 'Failed to fetch inventory'}), 500
+        """List inventory items.
+        
+        Query parameters: limit, cursor or after_id, fields (comma separated),
+        sort (id, name, retail_price or import_cost; prefix with - for
+        descending) and the filters category, material, color, min_price,
+        max_price, min_cost and max_cost. The next page's cursor is returned
+        in the X-Next-Cursor header. stream=1 or Accept: application/x-ndjson
+        streams every match instead.
+        """
+        return await InventoryAPI.LISTING.respond(request.args, 'inventory')
+    
+    @staticmethod
+    async def search_inventory():
+        """Substring or fuzzy search over product names and tags.
+        
+        Query parameters: q, mode (fuzzy, the default, or substring), limit and
+        threshold (minimum word similarity for fuzzy matches).
+        """
+        return await InventoryAPI.SEARCH.respond(request.args, 'inventory')
 
 def convert_to_relative_path(absolute_path: Optional[str]) -> Optional[str]:
     """Convert absolute image path to relative path"""
@@ -671,33 +2335,771 @@ def convert_to_relative_path(absolute_path: Optional[str]) -> Optional[str]:
     path_parts = absolute_path.split('data/images/inventory/')
     return path_parts[1] if len(path_parts) > 1 else absolute_path
 
+class WriteBehindConfig:
+    """Batching thresholds for buffered database writes"""
+    # Flush once this many rows are waiting
+    MAX_ROWS = int(os.getenv('WRITE_BUFFER_MAX_ROWS', '100'))
+    # Flush rows that have waited this many seconds
+    MAX_DELAY = float(os.getenv('WRITE_BUFFER_MAX_DELAY', '2.0'))
+    # Batches at least this large go through COPY + merge instead of executemany
+    COPY_THRESHOLD = int(os.getenv('WRITE_BUFFER_COPY_THRESHOLD', '20'))
+
+class WriteBehindBuffer:
+    """Collects upsert rows and writes them to a table in batches.
+    
+    Small batches are sent with one pipelined ``executemany``; larger ones are
+    COPY'd into a temporary staging table and merged with a single
+    ``INSERT ... SELECT ... ON CONFLICT``. A flush happens when ``max_rows`` rows
+    are waiting or when the oldest row has waited ``max_delay`` seconds. Once a
+    row is committed (or definitively fails) ``on_flush(item, error)`` is called.
+    """
+    def __init__(self, pool: asyncpg.Pool, table: str, columns: Tuple[str, ...], conflict_column: str,
+                 on_flush: Optional[Callable[[Any, Optional[Exception]], None]] = None,
+                 touch_columns: Tuple[str, ...] = ('updated_at',),
+                 max_rows: Optional[int] = None, max_delay: Optional[float] = None):
+        self.pool = pool
+        self.table = table
+        self.columns = columns
+        self.conflict_column = conflict_column
+        self.on_flush = on_flush
+        self.max_rows = max_rows or WriteBehindConfig.MAX_ROWS
+        self.max_delay = max_delay if max_delay is not None else WriteBehindConfig.MAX_DELAY
+        self._rows: List[Tuple[Tuple[Any, ...], Any]] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        
+        column_list = ', '.join(columns)
+        updates = [f"{col} = EXCLUDED.{col}" for col in columns if col != conflict_column]
+        updates.extend(f"{col} = CURRENT_TIMESTAMP" for col in touch_columns)
+        conflict_clause = f"ON CONFLICT ({conflict_column}) DO UPDATE SET {', '.join(updates)}"
+        placeholders = ', '.join(f'${i}' for i in range(1, len(columns) + 1))
+        self._stage_table = f"{table}_write_stage"
+        self._insert_sql = f"INSERT INTO {table} ({column_list}) VALUES ({placeholders}) {conflict_clause}"
+        self._stage_sql = f"CREATE TEMP TABLE {self._stage_table} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA"
+        self._merge_sql = f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {self._stage_table} {conflict_clause}"
+    
+    async def __aenter__(self) -> 'WriteBehindBuffer':
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    async def add(self, row: Tuple[Any, ...], item: Any = None) -> None:
+        """Queue a row; flushes inline when the size threshold is reached."""
+        self._rows.append((tuple(row), item))
+        if len(self._rows) >= self.max_rows:
+            await self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        try:
+            # Shielded so close() cancelling the timer can't abandon a flush midway
+            await asyncio.shield(self.flush())
+        except Exception as e:
+            logger.error(f"Deferred flush into {self.table} failed: {e}")
+    
+    async def flush(self) -> None:
+        """Write every pending row."""
+        async with self._lock:
+            if not self._rows:
+                return
+            pending, self._rows = self._rows, []
+            
+            # ON CONFLICT cannot touch the same row twice in one statement; keep the newest
+            key_index = self.columns.index(self.conflict_column)
+            latest = {}
+            for row, item in pending:
+                latest[row[key_index]] = row
+            rows = list(latest.values())
+            
+            try:
+                async with self.pool.acquire() as conn:
+                    if len(rows) >= WriteBehindConfig.COPY_THRESHOLD:
+                        async with conn.transaction():
+                            await conn.execute(self._stage_sql)
+                            await conn.copy_records_to_table(self._stage_table, records=rows, columns=list(self.columns))
+                            await conn.execute(self._merge_sql)
+                    else:
+                        await conn.executemany(self._insert_sql, rows)
+                logger.info(f"Flushed {len(rows)} rows into {self.table}")
+                errors = {}
+            except Exception as e:
+                # Fall back to row-by-row so one bad row doesn't sink its whole batch
+                logger.warning(f"Batch write of {len(rows)} rows into {self.table} failed ({e}); retrying individually")
+                try:
+                    errors = await self._write_individually(rows, key_index)
+                except Exception as e:
+                    # No connection for the fallback either: report every row as failed rather than drop it
+                    logger.error(f"Could not write {len(rows)} rows into {self.table}: {e}")
+                    errors = {row[key_index]: e for row in rows}
+            
+            if self.on_flush:
+                for row, item in pending:
+                    self.on_flush(item, errors.get(row[key_index]))
+    
+    async def _write_individually(self, rows: List[Tuple[Any, ...]], key_index: int) -> Dict[Any, Exception]:
+        errors = {}
+        async with self.pool.acquire() as conn:
+            for row in rows:
+                try:
+                    await conn.execute(self._insert_sql, *row)
+                except Exception as e:
+                    logger.error(f"Error writing {row[key_index]} into {self.table}: {e}")
+                    errors[row[key_index]] = e
+        return errors
+    
+    async def close(self) -> None:
+        """Cancel the deferred flush and write whatever is left."""
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+        await self.flush()
+
+class ExtractionConfig:
+    """Text extraction worker pool settings"""
+    WORKERS = int(os.getenv('EXTRACTION_WORKERS', str(os.cpu_count() or 2)))
+    # Seconds allowed for extracting one document
+    TIMEOUT = float(os.getenv('EXTRACTION_TIMEOUT', '120'))
+    # PDFs with at least this many pages are split into page ranges
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv('EXTRACTION_PDF_PARALLEL_MIN_PAGES', '40'))
+    PDF_PAGES_PER_CHUNK = int(os.getenv('EXTRACTION_PDF_PAGES_PER_CHUNK', '20'))
+
+class TextExtractionEngine:
+    """Runs the extractors registry in a process pool, off the event loop.
+    
+    Workers are spawned rather than forked, so they don't inherit the server's
+    loop and sockets. A spawned worker imports ``extractors`` plus whatever the
+    parent's main module imports at top level, which is why worker.py imports
+    ``server`` lazily. A running extraction can't be cancelled, so after a
+    timeout the pool is swapped for a fresh one, and the old pool's processes
+    are terminated once its other jobs have had their own EXTRACTION_TIMEOUT.
+    Each pool generation's workers report their pids on a queue of its own,
+    which is how the old pool's processes are told apart from the new one's.
+    """
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pids: Any = None
+    
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            self._pids = context.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=max(1, ExtractionConfig.WORKERS),
+                mp_context=context,
+                initializer=extractors.report_pid,
+                initargs=(self._pids,)
+            )
+        return self._executor
+    
+    @staticmethod
+    def supports(file_ext: str) -> bool:
+        return file_ext.lower().lstrip('.') in extractors.EXTRACTORS
+    
+    async def _run(self, func: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    async def _extract_pdf(self, path: str) -> Dict[str, Any]:
+        page_count = await self._run(extractors.pdf_page_count, path)
+        if page_count < ExtractionConfig.PDF_PARALLEL_MIN_PAGES:
+            return await self._run(extractors.extract_pdf, path)
+        
+        step = max(1, ExtractionConfig.PDF_PAGES_PER_CHUNK)
+        chunks = await asyncio.gather(*(
+            self._run(extractors.extract_pdf_pages, path, start, start + step)
+            for start in range(0, page_count, step)
+        ))
+        return {'text': "\n".join(page for chunk in chunks for page in chunk), 'page_count': page_count}
+    
+    async def extract(self, path: Path, file_ext: str) -> Dict[str, Any]:
+        """Extract ``text`` and ``page_count`` from a file, bounded by EXTRACTION_TIMEOUT."""
+        ext = file_ext.lower().lstrip('.')
+        if ext not in extractors.EXTRACTORS:
+            raise ValueError(f"Unsupported file type: .{ext}")
+        
+        if ext == 'pdf':
+            job = self._extract_pdf(str(path))
+        else:
+            job = self._run(extractors.EXTRACTORS[ext], str(path))
+        try:
+            return await asyncio.wait_for(job, timeout=ExtractionConfig.TIMEOUT)
+        except asyncio.TimeoutError:
+            self._recycle()
+            raise Exception(f"Text extraction timed out after {ExtractionConfig.TIMEOUT:.0f}s")
+    
+    def _recycle(self) -> None:
+        """Send new work to a fresh pool and terminate the old one after a grace period"""
+        old, self._executor = self._executor, None
+        pids, self._pids = self._pids, None
+        if old is None:
+            return
+        logger.warning("Replacing the text extraction pool after a timed-out extraction")
+        old.shutdown(wait=False, cancel_futures=True)
+        asyncio.get_running_loop().call_later(ExtractionConfig.TIMEOUT, self._terminate, pids)
+    
+    @staticmethod
+    def _terminate(pids: Any) -> None:
+        generation = set()
+        while not pids.empty():
+            generation.add(pids.get())
+        pids.close()
+        # Only children that haven't been reaped, so a reused pid is never signalled
+        for process in multiprocessing.active_children():
+            if process.pid in generation:
+                process.terminate()
+    
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pids.close()
+            self._pids = None
+
+extraction_engine = TextExtractionEngine()
+
+class ImageConfig:
+    """Image preprocessing settings"""
+    # Longest edge, in pixels, of the image sent to the model
+    MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '512'))
+    JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+    WORKERS = int(os.getenv('IMAGE_WORKERS', str(min(8, os.cpu_count() or 2))))
+
+class ImagePreprocessor:
+    """Runs FileProcessor.prepare_image on a worker pool.
+    
+    Pillow releases the GIL while decoding and resampling, so threads give real
+    parallelism here without pickling image bytes across processes.
+    """
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, ImageConfig.WORKERS), thread_name_prefix='image')
+        return self._executor
+    
+    async def prepare(self, image_data: bytes) -> Tuple[str, Dict[str, float]]:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, FileProcessor.prepare_image, image_data)
+    
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+image_preprocessor = ImagePreprocessor()
+
+class AnalysisCacheConfig:
+    """Model result cache settings"""
+    # Entries kept in each worker's in-process LRU
+    MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', '2048'))
+    # Results older than this are treated as misses and evicted
+    TTL_SECONDS = float(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', str(30 * 86400)))
+    # Rows kept per namespace in analysis_cache; least recently used rows go first
+    MAX_ROWS = int(os.getenv('ANALYSIS_CACHE_MAX_ROWS', '100000'))
+
+class AnalysisCache:
+    """In-process LRU in front of the analysis_cache table.
+    
+    Keys are content addressed (see make_key), so a hit is safe to reuse no
+    matter which file name or URL the content arrived under. Database writes go
+    through a WriteBehindBuffer and are flushed in batches.
+    """
+    def __init__(self, namespace: str, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.namespace = namespace
+        self.max_entries = max_entries or AnalysisCacheConfig.MEMORY_ENTRIES
+        self.ttl_seconds = ttl_seconds or AnalysisCacheConfig.TTL_SECONDS
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._buffer: Optional[WriteBehindBuffer] = None
+        self.counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Stable digest of the inputs that determine a model result"""
+        return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    
+    def _remember(self, key: str, value: Dict[str, Any], stored_at: Optional[float] = None) -> None:
+        self._entries[key] = (stored_at if stored_at is not None else time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+    
+    async def get(self, pool: asyncpg.Pool, key: str) -> Optional[Dict[str, Any]]:
+        """Cached result for key, or None"""
+        if key in self._entries:
+            stored_at, value = self._entries[key]
+            if time.time() - stored_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return dict(value)
+            del self._entries[key]
+        
+        async with pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                UPDATE analysis_cache SET last_used_at = CURRENT_TIMESTAMP
+                WHERE cache_key = $1
+                  AND created_at > CURRENT_TIMESTAMP - make_interval(secs => $2)
+                RETURNING result, EXTRACT(EPOCH FROM created_at) AS stored_at
+            """, key, self.ttl_seconds)
+        if row is None:
+            self.counters['misses'] += 1
+            return None
+        result = row['result']
+        value = json.loads(result) if isinstance(result, str) else result
+        self._remember(key, value, float(row['stored_at']))
+        self.counters['db_hits'] += 1
+        return dict(value)
+    
+    async def set(self, pool: asyncpg.Pool, key: str, value: Dict[str, Any]) -> None:
+        """Store a result in memory now and in the database on the next flush"""
+        self._remember(key, value)
+        self.counters['stores'] += 1
+        if self._buffer is None or self._buffer.pool is not pool:
+            self._buffer = WriteBehindBuffer(pool, 'analysis_cache', ('cache_key', 'namespace', 'result'),
+                                             'cache_key', touch_columns=('created_at', 'last_used_at'))
+        await self._buffer.add((key, self.namespace, json.dumps(value)))
+    
+    async def evict(self, pool: asyncpg.Pool) -> int:
+        """Delete expired rows and trim the namespace to MAX_ROWS"""
+        async with pool.acquire() as conn:
+            expired = await conn.execute("""
+                DELETE FROM analysis_cache
+                WHERE namespace = $1 AND created_at <= CURRENT_TIMESTAMP - make_interval(secs => $2)
+            """, self.namespace, self.ttl_seconds)
+            trimmed = await conn.execute("""
+                DELETE FROM analysis_cache
+                WHERE cache_key IN (
+                    SELECT cache_key FROM analysis_cache
+                    WHERE namespace = $1
+                    ORDER BY last_used_at DESC
+                    OFFSET $2
+                )
+            """, self.namespace, AnalysisCacheConfig.MAX_ROWS)
+        removed = int(expired.split()[-1]) + int(trimmed.split()[-1])
+        self.counters['evictions'] += removed
+        return removed
+    
+    def snapshot(self) -> Dict[str, Any]:
+        hits = self.counters['memory_hits'] + self.counters['db_hits']
+        lookups = hits + self.counters['misses']
+        return {
+            **self.counters,
+            'memory_entries': len(self._entries),
+            'hit_rate': round(hits / lookups, 4) if lookups else None
+        }
+    
+    async def close(self) -> None:
+        if self._buffer is not None:
+            await self._buffer.close()
+
+image_analysis_cache = AnalysisCache('image')
+document_analysis_cache = AnalysisCache('document')
+
+def document_content_hash(text: str) -> str:
+    """Hash of extracted text with case, Unicode form and whitespace normalized"""
+    normalized = ' '.join(unicodedata.normalize('NFKC', text).lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def document_cache_key(content_hash: str) -> str:
+    """Analysis cache key for a document's normalized text"""
+    return AnalysisCache.make_key(content_hash, DOCUMENT_PROMPT_VERSION, DOCUMENT_MODEL)
+
+async def lookup_document_analysis(pool: asyncpg.Pool, content_hash: str) -> Optional[Dict[str, Any]]:
+    """Earlier analysis of the same normalized text, if any.
+    
+    Looks in the analysis cache first, then in document_vault for a document
+    already stored with this content hash.
+    """
+    key = document_cache_key(content_hash)
+    cached = await document_analysis_cache.get(pool, key)
+    if cached is not None:
+        return cached
+    
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("""
+            SELECT title, author, journal_publisher, publication_year, thesis, issue,
+                   summary, category, field, hashtags, influenced_by
+            FROM document_vault
+            WHERE content_hash = $1
+            ORDER BY last_analyzed DESC
+            LIMIT 1
+        """, content_hash)
+    if row is not None:
+        doc_info = dict(row)
+        for field in ('hashtags', 'influenced_by'):
+            doc_info[field] = [value for value in (doc_info[field] or '').split(',') if value]
+        await document_analysis_cache.set(pool, key, doc_info)
+        return doc_info
+    return None
+
+async def analyze_document_cached(pool: asyncpg.Pool, text: str, content_hash: str) -> Dict[str, Any]:
+    """Metadata for a document's text, reusing earlier results for the same normalized text.
+    
+    The model is called through request_document_analysis only when
+    lookup_document_analysis finds nothing, and its result is cached.
+    A failed model call raises, so the document is recorded as failed and
+    can be retried instead of being stored with placeholder metadata.
+    """
+    doc_info = await lookup_document_analysis(pool, content_hash)
+    if doc_info is not None:
+        return doc_info
+    
+    doc_info = await request_document_analysis(text)
+    await document_analysis_cache.set(pool, document_cache_key(content_hash), doc_info)
+    return doc_info
+
+class EmbeddingConfig:
+    """Chunk embeddings for semantic document search"""
+    ENABLED = os.getenv('DOCUMENT_EMBEDDINGS_ENABLED', 'true').lower() == 'true'
+    MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+    # Must match the vector(...) column once document_chunks exists
+    DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS', '1536'))
+    CHUNK_TOKENS = int(os.getenv('EMBEDDING_CHUNK_TOKENS', '400'))
+    MAX_CHUNKS_PER_DOCUMENT = int(os.getenv('EMBEDDING_MAX_CHUNKS_PER_DOCUMENT', '256'))
+    # Inputs and estimated tokens per embeddings request
+    BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '128'))
+    BATCH_MAX_TOKENS = int(os.getenv('EMBEDDING_BATCH_MAX_TOKENS', '200000'))
+    # HNSW candidate list size at query time; higher trades speed for recall
+    EF_SEARCH = int(os.getenv('EMBEDDING_EF_SEARCH', '80'))
+    # Chunks held in memory by the no-pgvector fallback, per worker process. Each costs
+    # DIMENSIONS * 4 bytes (6 KB at 1536 dims, so the default is about 300 MB); past the
+    # cap only the newest chunks are searched
+    NUMPY_MAX_CHUNKS = int(os.getenv('EMBEDDING_NUMPY_MAX_CHUNKS', '50000'))
+    # Rows read per query while loading new chunks into that index
+    NUMPY_LOAD_PAGE = int(os.getenv('EMBEDDING_NUMPY_LOAD_PAGE', '2000'))
+
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embedding vectors for texts, in order, from one embeddings request"""
+    response = await openai_scheduler.embeddings(
+        sum(estimate_tokens(text) for text in texts),
+        model=EmbeddingConfig.MODEL,
+        input=texts,
+        extra_body={'dimensions': EmbeddingConfig.DIMENSIONS}
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def vector_literal(vector: List[float]) -> str:
+    """pgvector text form of a vector, sent as text and cast in SQL"""
+    return '[' + ','.join(f"{value:.7g}" for value in vector) + ']'
+
+class NumpyVectorIndex:
+    """Brute-force cosine index over document_chunks kept in worker memory.
+    
+    Used when pgvector is unavailable and embeddings are stored as REAL[].
+    Every worker holds its own float32 matrix of up to EMBEDDING_NUMPY_MAX_CHUNKS
+    chunks, DIMENSIONS * 4 bytes each. Chunk ids only grow (re-embedding a
+    document replaces its rows), so when document_chunks' row in
+    table_versions changes, only rows past the last id loaded are read, a page
+    at a time. Ids are re-read to drop deleted chunks only when the table has
+    fewer rows than the index.
+    """
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.last_id = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, EmbeddingConfig.DIMENSIONS), dtype=np.float32)
+        self._lock: Optional[asyncio.Lock] = None
+        self._capped = False
+    
+    async def refresh(self, conn: asyncpg.Connection) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            version = await conn.fetchval(
+                "SELECT version FROM table_versions WHERE table_name = 'document_chunks'"
+            )
+            if version is not None and version == self.version:
+                return
+            ids, matrix = self.ids, self.matrix
+            if len(ids) and await conn.fetchval(
+                'SELECT count(*) FROM document_chunks WHERE id BETWEEN $1 AND $2', int(ids[0]), self.last_id
+            ) < len(ids):
+                current = await conn.fetch(
+                    'SELECT id FROM document_chunks WHERE id BETWEEN $1 AND $2', int(ids[0]), self.last_id
+                )
+                keep = np.isin(ids, np.array([row['id'] for row in current], dtype=np.int64))
+                ids, matrix = ids[keep], matrix[keep]
+            
+            new_ids, new_rows = [], []
+            while True:
+                rows = await conn.fetch(
+                    'SELECT id, embedding FROM document_chunks WHERE id > $1 ORDER BY id LIMIT $2',
+                    self.last_id, EmbeddingConfig.NUMPY_LOAD_PAGE
+                )
+                if not rows:
+                    break
+                page = np.array([row['embedding'] for row in rows], dtype=np.float32)
+                page /= np.maximum(np.linalg.norm(page, axis=1, keepdims=True), 1e-12)
+                new_ids.append(np.array([row['id'] for row in rows], dtype=np.int64))
+                new_rows.append(page)
+                self.last_id = rows[-1]['id']
+            if new_rows:
+                ids = np.concatenate([ids, *new_ids])
+                matrix = np.vstack([matrix, *new_rows])
+            if len(ids) > EmbeddingConfig.NUMPY_MAX_CHUNKS:
+                if not self._capped:
+                    logger.warning(f"Semantic search fallback holds only the newest {EmbeddingConfig.NUMPY_MAX_CHUNKS} "
+                                   f"chunks; install pgvector or raise EMBEDDING_NUMPY_MAX_CHUNKS")
+                    self._capped = True
+                # Copied, so the dropped rows are freed rather than kept alive under a view
+                ids, matrix = ids[-EmbeddingConfig.NUMPY_MAX_CHUNKS:].copy(), matrix[-EmbeddingConfig.NUMPY_MAX_CHUNKS:].copy()
+            self.ids, self.matrix, self.version = ids, matrix, version
+    
+    def search(self, vector: List[float], k: int) -> List[Tuple[int, float]]:
+        """(chunk id, cosine similarity) of the k nearest chunks"""
+        if not len(self.ids):
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+class DocumentEmbeddingIndex:
+    """Chunk-level embeddings of document_vault text and nearest-neighbor search over them.
+    
+    Chunks live in document_chunks with a pgvector column and an HNSW index
+    when the extension is available, otherwise as REAL[] searched through
+    NumpyVectorIndex. initialize_database sets ``backend`` to 'pgvector',
+    'numpy' or None when neither is usable.
+    """
+    def __init__(self):
+        self.backend: Optional[str] = None
+        self.numpy_index: Optional[NumpyVectorIndex] = None
+    
+    def configure(self, backend: Optional[str]) -> None:
+        if backend == 'numpy' and np is None:
+            logger.warning("pgvector and numpy are both unavailable, semantic search is disabled")
+            backend = None
+        self.backend = backend
+        self.numpy_index = NumpyVectorIndex() if backend == 'numpy' else None
+    
+    def _embedding_param(self) -> str:
+        return '$5::text::vector' if self.backend == 'pgvector' else '$5::real[]'
+    
+    async def index_documents(self, pool: asyncpg.Pool, file_paths: List[str]) -> int:
+        """Embed every listed document whose chunks are missing or stale; returns chunks written.
+        
+        Chunks from several documents share embeddings requests, up to
+        EMBEDDING_BATCH_SIZE inputs or EMBEDDING_BATCH_MAX_TOKENS each.
+        """
+        if not EmbeddingConfig.ENABLED or self.backend is None or not file_paths:
+            return 0
+        async with pool.acquire() as conn:
+            stale = await conn.fetch("""
+                SELECT d.id, d.content_hash
+                FROM document_vault d
+                WHERE d.file_path = ANY($1)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM document_chunks c
+                      WHERE c.document_id = d.id AND c.content_hash IS NOT DISTINCT FROM d.content_hash
+                  )
+            """, file_paths)
+        
+        written = 0
+        batch: List[Tuple[int, int, str, Optional[str]]] = []
+        batch_tokens = 0
+        
+        async def flush() -> None:
+            nonlocal batch, batch_tokens, written
+            if not batch:
+                return
+            vectors = await embed_texts([chunk for _, _, chunk, _ in batch])
+            async with pool.acquire() as conn:
+                await conn.executemany(f"""
+                    INSERT INTO document_chunks (document_id, chunk_index, content, content_hash, embedding)
+                    VALUES ($1, $2, $3, $4, {self._embedding_param()})
+                    ON CONFLICT (document_id, chunk_index) DO UPDATE
+                    SET content = EXCLUDED.content, content_hash = EXCLUDED.content_hash, embedding = EXCLUDED.embedding
+                """, [
+                    (document_id, index, chunk, content_hash,
+                     vector_literal(vector) if self.backend == 'pgvector' else vector)
+                    for (document_id, index, chunk, content_hash), vector in zip(batch, vectors)
+                ])
+            written += len(batch)
+            batch, batch_tokens = [], 0
+        
+        for row in stale:
+            async with pool.acquire() as conn:
+                text = await conn.fetchval('SELECT extracted_text FROM document_vault WHERE id = $1', row['id'])
+                await conn.execute('DELETE FROM document_chunks WHERE document_id = $1', row['id'])
+            chunk_tokens = EmbeddingConfig.CHUNK_TOKENS
+            chunks = select_chunks(
+                [chunk for chunk in chunk_text(text or '', chunk_tokens) if chunk.strip()],
+                EmbeddingConfig.MAX_CHUNKS_PER_DOCUMENT * chunk_tokens, chunk_tokens
+            )
+            for index, chunk in enumerate(chunks):
+                tokens = estimate_tokens(chunk)
+                if batch and (len(batch) >= EmbeddingConfig.BATCH_SIZE
+                              or batch_tokens + tokens > EmbeddingConfig.BATCH_MAX_TOKENS):
+                    await flush()
+                batch.append((row['id'], index, chunk, row['content_hash']))
+                batch_tokens += tokens
+        await flush()
+        if written:
+            logger.info(f"Embedded {written} chunks from {len(stale)} documents")
+        return written
+    
+    async def search(self, pool: asyncpg.Pool, query: str, k: int) -> List[Dict[str, Any]]:
+        """The k documents with the chunks nearest to query, each with its best passage"""
+        query_vector = (await embed_texts([query]))[0]
+        # Several chunks can come from one document, so over-fetch before grouping
+        candidates = k * 4
+        async with pool.acquire() as conn:
+            if self.backend == 'pgvector':
+                async with conn.transaction():
+                    await conn.execute(
+                        "SELECT set_config('hnsw.ef_search', $1, true)", str(max(EmbeddingConfig.EF_SEARCH, candidates))
+                    )
+                    rows = await conn.fetch("""
+                        SELECT id, document_id, chunk_index, content,
+                               1 - (embedding <=> $1::text::vector) AS similarity
+                        FROM document_chunks
+                        ORDER BY embedding <=> $1::text::vector
+                        LIMIT $2
+                    """, vector_literal(query_vector), candidates)
+            else:
+                await self.numpy_index.refresh(conn)
+                scored = dict(self.numpy_index.search(query_vector, candidates))
+                rows = await conn.fetch("""
+                    SELECT id, document_id, chunk_index, content
+                    FROM document_chunks
+                    WHERE id = ANY($1)
+                """, list(scored))
+                rows = sorted(({**dict(row), 'similarity': scored[row['id']]} for row in rows),
+                              key=lambda row: row['similarity'], reverse=True)
+            
+            best: Dict[int, Any] = {}
+            for row in rows:
+                if row['document_id'] not in best:
+                    best[row['document_id']] = row
+            top = list(best.values())[:k]
+            documents = {row['id']: row for row in await conn.fetch("""
+                SELECT id, title, author, category, field, summary, publication_year
+                FROM document_vault
+                WHERE id = ANY($1)
+            """, [row['document_id'] for row in top])}
+        
+        return [{
+            **dict(documents[row['document_id']]),
+            'similarity': float(row['similarity']),
+            'chunk_index': row['chunk_index'],
+            'passage': row['content']
+        } for row in top if row['document_id'] in documents]
+
+document_embeddings = DocumentEmbeddingIndex()
+
 class FileProcessor:
     """File processing utilities"""
     
+    IMAGE_MODEL = "gpt-4o"
+    # Bump whenever build_image_prompt changes so cached analyses are not reused
+    IMAGE_PROMPT_VERSION = "1"
+    # Approximate input tokens billed for one image at IMAGE_MAX_DIMENSION
+    IMAGE_INPUT_TOKENS = 255
+    # Output tokens budgeted per image in a batched request
+    IMAGE_OUTPUT_TOKENS = 400
+    
+    IMAGE_ANALYSIS_FIELDS = {
+        "name": str,
+        "description": str,
+        "category": str,
+        "material": str,
+        "color": str,
+        "dimensions": str,
+        "origin_source": str,
+        "import_cost": (int, float),
+        "retail_price": (int, float),
+        "key_tags": str
+    }
+    
+    PRODUCT_COLUMNS = (
+        'name', 'description', 'image_url', 'category', 'material',
+        'color', 'dimensions', 'origin_source', 'import_cost', 'retail_price',
+        'key_tags', 'content_hash', 'source_etag'
+    )
+    
+    DOCUMENT_COLUMNS = (
+        'title', 'author', 'journal_publisher', 'publication_year',
+        'page_length', 'thesis', 'issue', 'summary', 'category',
+        'field', 'hashtags', 'influenced_by', 'file_path',
+        'file_type', 'extracted_text', 'content_hash'
+    )
+    
+    @staticmethod
+    def product_buffer(pool: asyncpg.Pool, on_flush: Optional[Callable[[Any, Optional[Exception]], None]] = None) -> 'WriteBehindBuffer':
+        """Write-behind buffer that upserts products keyed on image_url"""
+        return WriteBehindBuffer(pool, 'products', FileProcessor.PRODUCT_COLUMNS, 'image_url', on_flush)
+    
+    @staticmethod
+    def document_buffer(pool: asyncpg.Pool, on_flush: Optional[Callable[[Any, Optional[Exception]], None]] = None) -> 'WriteBehindBuffer':
+        """Write-behind buffer that upserts document_vault rows keyed on file_path"""
+        return WriteBehindBuffer(pool, 'document_vault', FileProcessor.DOCUMENT_COLUMNS, 'file_path', on_flush,
+                                 touch_columns=('updated_at', 'last_analyzed'))
+    
+    @staticmethod
+    def product_row(image_url: str, analysis: Dict[str, Any], content_hash: Optional[str] = None,
+                    source_etag: Optional[str] = None) -> Tuple[Any, ...]:
+        """Row for PRODUCT_COLUMNS from a sanitized analysis"""
+        return (
+            analysis['name'],
+            analysis['description'],
+            image_url,
+            analysis['category'],
+            analysis['material'],
+            analysis['color'],
+            analysis['dimensions'],
+            analysis['origin_source'],
+            float(analysis.get('import_cost', 0)),
+            float(analysis.get('retail_price', 0)),
+            analysis.get('key_tags', ''),
+            content_hash,
+            source_etag
+        )
+    
+    @staticmethod
+    def document_row(doc: Dict[str, str], doc_info: Dict[str, Any], text: str, page_length: int,
+                     content_hash: Optional[str] = None) -> Tuple[Any, ...]:
+        """Row for DOCUMENT_COLUMNS from a document analysis"""
+        def join_values(value: Any) -> str:
+            if isinstance(value, (list, tuple)):
+                return ','.join(str(v) for v in value)
+            return value or ''
+        
+        try:
+            publication_year = int(doc_info.get('publication_year'))
+        except (TypeError, ValueError):
+            publication_year = None
+        
+        return (
+            doc_info.get('title') or doc['name'],
+            doc_info.get('author', ''),
+            doc_info.get('journal_publisher', ''),
+            publication_year,
+            page_length,
+            doc_info.get('thesis', ''),
+            doc_info.get('issue', ''),
+            (doc_info.get('summary') or '')[:400],
+            doc_info.get('category') or 'Document',
+            doc_info.get('field', ''),
+            join_values(doc_info.get('hashtags', [])),
+            join_values(doc_info.get('influenced_by', [])),
+            doc['url'],
+            os.path.splitext(doc['name'])[1].lower()[1:],
+            text,
+            content_hash or document_content_hash(text)
+        )
+    
     @staticmethod
-    async def analyze_image_with_gpt4v(image_url: str, instruction: str) -> dict:
-        """Analyze image using GPT-4V"""
-        try:
-            # Download and process image
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status != 200:
-                        raise Exception(f"Failed to fetch image: {response.status}")
-                    image_data = await response.read()
-            
-            # Resize image
-            img = Image.open(io.BytesIO(image_data))
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-            img.thumbnail((512, 512), Image.Resampling.LANCZOS)
-            
-            # Convert to base64
-            buffered = io.BytesIO()
-            img.save(buffered, format="JPEG", quality=85)
-            base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            
-            # Prepare prompt
-            prompt = f"""
+    def build_image_prompt(instruction: str) -> str:
+        """Cataloging prompt sent alongside each image"""
+        return f"""
             You are an assistant that catalogs and analyzes products for an inventory system.
             {instruction}
             Please respond ONLY with valid JSON containing these fields:
@@ -715,185 +3117,509 @@ class FileProcessor:
             }}
             If a field is unavailable, write "N/A" (not empty or null).
             """
+    
+    @staticmethod
+    def sanitize_image_analysis(result: Dict[str, Any]) -> dict:
+        """Validate and sanitize each field of a model response"""
+        sanitized_result = {}
+        for field, expected_type in FileProcessor.IMAGE_ANALYSIS_FIELDS.items():
+            value = result.get(field)
             
-            # Call GPT-4V
-            response = await client.chat.completions.create(
-                model="gpt-4o", 
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
+            # Handle numeric fields
+            if expected_type in [(int, float), float, int]:
+                try:
+                    sanitized_result[field] = float(value if value is not None else 0)
+                except (TypeError, ValueError):
+                    sanitized_result[field] = 0.0
+                    logger.warning(f"Invalid numeric value for {field}: {value}")
+            # Handle string fields
+            else:
+                if not value or not isinstance(value, str):
+                    sanitized_result[field] = "N/A"
+                    logger.warning(f"Invalid or missing string value for {field}: {value}")
+                else:
+                    sanitized_result[field] = value.strip()
+        
+        return sanitized_result
+    
+    @staticmethod
+    def prepare_image(image_data: bytes) -> Tuple[str, Dict[str, float]]:
+        """Orient, downscale and re-encode an image.
+        
+        Returns the base64 JPEG and the seconds spent decoding, orienting,
+        resizing and encoding. JPEGs are decoded with draft() so the decoder
+        scales down by a power of two before the final LANCZOS resample.
+        """
+        timings = {}
+        started = time.perf_counter()
+        size = (ImageConfig.MAX_DIMENSION, ImageConfig.MAX_DIMENSION)
+        
+        img = Image.open(io.BytesIO(image_data))
+        if img.format == 'JPEG':
+            img.draft('RGB', size)
+        img.load()
+        timings['decode'] = time.perf_counter() - started
+        
+        mark = time.perf_counter()
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        timings['orient'] = time.perf_counter() - mark
+        
+        mark = time.perf_counter()
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        timings['resize'] = time.perf_counter() - mark
+        
+        mark = time.perf_counter()
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG", quality=ImageConfig.JPEG_QUALITY)
+        encoded = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        timings['encode'] = time.perf_counter() - mark
+        return encoded, timings
+    
+    @staticmethod
+    def image_request(base64_image: str, instruction: str) -> Dict[str, Any]:
+        """Chat completion parameters for analyzing one prepared image"""
+        return {
+            'model': FileProcessor.IMAGE_MODEL,
+            'messages': [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": FileProcessor.build_image_prompt(instruction)},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
                         }
-                    ]
-                }],
-                max_tokens=2000
-            )
-            
-            # Parse response
-            text_response = response.choices[0].message.content.strip()
-            
-            try:
-                # Attempt to parse JSON response
-                result = json.loads(text_response)
-                
-                # Validate required fields and structure
-                required_fields = {
-                    "name": str,
-                    "description": str,
-                    "category": str,
-                    "material": str,
-                    "color": str,
-                    "dimensions": str,
-                    "origin_source": str,
-                    "import_cost": (int, float),
-                    "retail_price": (int, float),
-                    "key_tags": str
-                }
-                
-                # Validate and sanitize each field
-                sanitized_result = {}
-                for field, expected_type in required_fields.items():
-                    value = result.get(field)
-                    
-                    # Handle numeric fields
-                    if expected_type in [(int, float), float, int]:
-                        try:
-                            sanitized_result[field] = float(value if value is not None else 0)
-                        except (TypeError, ValueError):
-                            sanitized_result[field] = 0.0
-                            logger.warning(f"Invalid numeric value for {field}: {value}")
-                    # Handle string fields
-                    else:
-                        if not value or not isinstance(value, str):
-                            sanitized_result[field] = "N/A"
-                            logger.warning(f"Invalid or missing string value for {field}: {value}")
-                        else:
-                            sanitized_result[field] = value.strip()
-                
-                return sanitized_result
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse GPT-4V response as JSON: {e}\nResponse: {text_response}")
-                raise Exception("Invalid JSON response from GPT-4V")
-            
-        except Exception as e:
-            logger.error(f"Error analyzing image with GPT-4V: {e}")
-            return {
-                "name": "Untitled Item",
-                "description": "N/A",
-                "category": "N/A",
-                "material": "N/A",
-                "color": "N/A",
-                "dimensions": "N/A",
-                "origin_source": "N/A",
-                "import_cost": 0.0,
-                "retail_price": 0.0,
-                "key_tags": "unclassified"
-            }
+                    }
+                ]
+            }],
+            'max_tokens': 2000
+        }
+    
+    @staticmethod
+    async def request_image_analysis(base64_image: str, instruction: str) -> dict:
+        """Send a prepared image to GPT-4V and return the sanitized fields"""
+        prompt = FileProcessor.build_image_prompt(instruction)
+        response = await openai_scheduler.chat_completion(
+            estimate_tokens(prompt) + FileProcessor.IMAGE_INPUT_TOKENS + 2000,
+            **FileProcessor.image_request(base64_image, instruction)
+        )
+        return FileProcessor.parse_image_response(response.choices[0].message.content)
+    
+    @staticmethod
+    def parse_image_response(content: str) -> dict:
+        """Sanitized fields from the text of a GPT-4V response"""
+        text_response = content.strip()
+        try:
+            result = json.loads(text_response)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse GPT-4V response as JSON: {e}\nResponse: {text_response}")
+            raise Exception("Invalid JSON response from GPT-4V")
+        return FileProcessor.sanitize_image_analysis(result)
+    
+    @staticmethod
+    def build_image_batch_prompt(instruction: str, count: int) -> str:
+        """Cataloging prompt for several images sent in one request"""
+        return f"""
+            You are an assistant that catalogs and analyzes products for an inventory system.
+            {instruction}
+            You will receive {count} images, numbered 0 to {count - 1} in the order they appear.
+            Catalog each image separately. Please respond ONLY with valid JSON of this shape:
+            {{
+                "items": [
+                    {{
+                        "index": <image number>,
+                        "name": "<string>",
+                        "description": "<string>",
+                        "category": "<string>",
+                        "material": "<string>",
+                        "color": "<string>",
+                        "dimensions": "<string>",
+                        "origin_source": "<string>",
+                        "import_cost": "<number>",
+                        "retail_price": "<number>",
+                        "key_tags": "<string>"
+                    }}
+                ]
+            }}
+            Include exactly one entry per image. If a field is unavailable, write "N/A" (not empty or null).
+            """
+    
+    @staticmethod
+    def vision_batch_limit(instruction: str) -> int:
+        """Images per batched request allowed by the batch size and token cap"""
+        configured = max(1, InventoryPipelineConfig.VISION_BATCH_SIZE)
+        if configured == 1:
+            return 1
+        prompt_tokens = estimate_tokens(FileProcessor.build_image_batch_prompt(instruction, configured))
+        per_image = FileProcessor.IMAGE_INPUT_TOKENS + FileProcessor.IMAGE_OUTPUT_TOKENS
+        by_tokens = (InventoryPipelineConfig.VISION_BATCH_MAX_TOKENS - prompt_tokens) // per_image
+        return max(1, min(configured, by_tokens))
     
     @staticmethod
-    async def process_image_batch(images: List[Dict[str, str]], instruction: str, conn: asyncpg.Connection) -> None:
-        """Process a batch of images efficiently"""
-        for image in images:
+    async def request_image_batch_analysis(base64_images: List[str], instruction: str) -> List[Optional[dict]]:
+        """Analyze several prepared images in one GPT-4V request.
+        
+        Returns one sanitized result per image, in order, with None for any
+        image the response left out or answered with something unusable.
+        Raises if the response as a whole can't be parsed.
+        """
+        prompt = FileProcessor.build_image_batch_prompt(instruction, len(base64_images))
+        max_tokens = FileProcessor.IMAGE_OUTPUT_TOKENS * len(base64_images)
+        content = [{"type": "text", "text": prompt}]
+        for index, base64_image in enumerate(base64_images):
+            content.append({"type": "text", "text": f"Image {index}:"})
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+            })
+        
+        response = await openai_scheduler.chat_completion(
+            estimate_tokens(prompt) + (FileProcessor.IMAGE_INPUT_TOKENS + FileProcessor.IMAGE_OUTPUT_TOKENS) * len(base64_images),
+            model=FileProcessor.IMAGE_MODEL,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+        
+        text_response = response.choices[0].message.content.strip()
+        try:
+            parsed = json.loads(text_response)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse batched GPT-4V response as JSON: {e}")
+            raise Exception("Invalid JSON response from GPT-4V")
+        entries = parsed.get('items') if isinstance(parsed, dict) else parsed
+        if not isinstance(entries, list):
+            raise Exception("Batched GPT-4V response has no items array")
+        
+        results: List[Optional[dict]] = [None] * len(base64_images)
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
             try:
-                analysis = await FileProcessor.analyze_image_with_gpt4v(image['url'], instruction)
-                
-                await conn.execute("""
-                    INSERT INTO products (
-                        name, description, image_url, category, material,
-                        color, dimensions, origin_source, import_cost, retail_price,
-                        key_tags
-                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-                    ON CONFLICT (image_url) DO UPDATE SET
-                        name = EXCLUDED.name,
-                        description = EXCLUDED.description,
-                        category = EXCLUDED.category,
-                        material = EXCLUDED.material,
-                        color = EXCLUDED.color,
-                        dimensions = EXCLUDED.dimensions,
-                        origin_source = EXCLUDED.origin_source,
-                        import_cost = EXCLUDED.import_cost,
-                        retail_price = EXCLUDED.retail_price,
-                        key_tags = EXCLUDED.key_tags
-                """,
-                    analysis['name'],
-                    analysis['description'],
-                    image['url'],
-                    analysis['category'],
-                    analysis['material'],
-                    analysis['color'],
-                    analysis['dimensions'],
-                    analysis['origin_source'],
-                    float(analysis.get('import_cost', 0)),
-                    float(analysis.get('retail_price', 0)),
-                    analysis.get('key_tags', '')
-                )
-            except Exception as e:
-                logger.error(f"Error processing image {image.get('name', 'unknown')}: {e}")
-                raise
+                index = int(entry.get('index'))
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < len(results) and results[index] is None and entry.get('name'):
+                results[index] = FileProcessor.sanitize_image_analysis(entry)
+        return results
     
     @staticmethod
-    async def process_document(doc: Dict[str, str], instruction: str, conn: asyncpg.Connection) -> None:
-        """Process document from Vercel Blob URL with improved error handling"""
+    async def process_document(doc: Dict[str, str], instruction: str, buffer: WriteBehindBuffer) -> None:
+        """Process document from Vercel Blob URL and queue it for the document_vault upsert"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(doc['url']) as response:
-                    if response.status != 200:
-                        raise Exception(f"Failed to fetch document: {response.status}")
-                    document_data = await response.read()
+            file_ext = os.path.splitext(doc['name'])[1].lower()
+            if not extraction_engine.supports(file_ext):
+                raise ValueError(f"Unsupported file type: {file_ext}")
             
-            # Extract text
-            with io.BytesIO(document_data) as doc_buffer:
-                file_ext = os.path.splitext(doc['name'])[1].lower()
-                
-                if file_ext == '.pdf':
-                    pdf_reader = PyPDF2.PdfReader(doc_buffer)
-                    text = "\n".join(page.extract_text() for page in pdf_reader.pages)
-                elif file_ext == '.docx':
-                    doc_obj = Document(doc_buffer)
-                    text = "\n".join(paragraph.text for paragraph in doc_obj.paragraphs)
-                elif file_ext == '.txt':
-                    text = document_data.decode('utf-8', errors='ignore')
-                else:
-                    raise ValueError(f"Unsupported file type: {file_ext}")
+            # Stream to disk and extract text in the worker pool
+            async with http_client.download_to_file(doc['url'], suffix=file_ext) as file_path:
+                extracted = await extraction_engine.extract(file_path, file_ext)
+            text = extracted['text']
             
-            # Analyze document
-            doc_info = await analyze_document(text)
+            # Analyze document, reusing the analysis of identical text
+            content_hash = document_content_hash(text)
+            doc_info = await analyze_document_cached(buffer.pool, text, content_hash)
             
             # Store in database
-            await conn.execute("""
-                INSERT INTO document_vault (
-                    title, author, journal_publisher, publication_year,
-                    page_length, thesis, issue, summary, category,
-                    field, hashtags, influenced_by, file_path,
-                    file_type, extracted_text
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15)
-            """,
-                doc_info.get('title', doc['name']),
-                doc_info.get('author', ''),
-                doc_info.get('journal_publisher', ''),
-                doc_info.get('publication_year'),
-                len(text.split('\n')),
-                doc_info.get('thesis', ''),
-                doc_info.get('issue', ''),
-                doc_info.get('summary', '')[:400],
-                doc_info.get('category', ''),
-                doc_info.get('field', ''),
-                ','.join(doc_info.get('hashtags', [])),
-                ','.join(doc_info.get('influenced_by', [])),
-                doc['url'],
-                file_ext[1:],
-                text
-            )
+            await buffer.add(FileProcessor.document_row(doc, doc_info, text, extracted['page_count'], content_hash), doc)
         except Exception as e:
             logger.error(f"Error processing document {doc['name']}: {e}")
             raise
 
+class InventoryPipelineConfig:
+    """Per-stage concurrency limits for inventory ingestion"""
+    DOWNLOAD_CONCURRENCY = int(os.getenv('INVENTORY_DOWNLOAD_CONCURRENCY', '8'))
+    PREPROCESS_CONCURRENCY = int(os.getenv('INVENTORY_PREPROCESS_CONCURRENCY', '4'))
+    ANALYSIS_CONCURRENCY = int(os.getenv('INVENTORY_ANALYSIS_CONCURRENCY', '4'))
+    WRITE_CONCURRENCY = int(os.getenv('INVENTORY_WRITE_CONCURRENCY', '2'))
+    # Capacity of the queue between consecutive stages
+    QUEUE_SIZE = int(os.getenv('INVENTORY_QUEUE_SIZE', '16'))
+    # Images packed into one vision request; 1 sends every image on its own
+    VISION_BATCH_SIZE = int(os.getenv('INVENTORY_VISION_BATCH_SIZE', '1'))
+    # Cap on estimated input plus output tokens of one batched request
+    VISION_BATCH_MAX_TOKENS = int(os.getenv('INVENTORY_VISION_BATCH_MAX_TOKENS', '12000'))
+    # Seconds the analysis stage waits for a batch to fill before sending it
+    VISION_BATCH_WAIT = float(os.getenv('INVENTORY_VISION_BATCH_WAIT', '0.5'))
+
+class InventoryPipeline:
+    """Download -> preprocess -> analyze -> write pipeline with bounded queues between stages.
+    
+    Every stage runs its own pool of workers, so network, CPU and model latency
+    overlap instead of being paid one image at a time. The write stage feeds a
+    WriteBehindBuffer, so an item is reported through ``on_item_done`` once its
+    row is committed, or as soon as it fails with its error.
+    
+    Before anything is downloaded, one query looks up which URLs are already
+    in products. Each item is tagged 'new', 'changed' or 'unchanged' in
+    ``item['catalog']``. Unchanged images are reported done straight after
+    the download stage: the blob answered 304 to the stored ETag, or its bytes
+    hash to the stored content_hash. Unless ``force`` is set, they never reach
+    the model.
+    """
+    def __init__(self, instruction: str, pool: asyncpg.Pool,
+                 on_item_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 force: bool = False):
+        self.instruction = instruction
+        self.pool = pool
+        self.on_item_done = on_item_done
+        self.force = force
+        self.buffer = FileProcessor.product_buffer(pool, self._on_flush)
+        self.timings: Dict[str, float] = {}
+        self.timed_items: Dict[str, int] = {}
+        # image_url -> (content_hash, source_etag) of products already cataloged
+        self.catalog: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        # (image_url, content_hash, source_etag) of unchanged products whose stored ETag is out of date
+        self.stale_etags: List[Tuple[str, str, Optional[str]]] = []
+        self.vision_batch_size = FileProcessor.vision_batch_limit(instruction)
+        # (handler, workers, items per call); handlers of batched stages take a list
+        self.stages = [
+            (self._download, InventoryPipelineConfig.DOWNLOAD_CONCURRENCY, 1),
+            (self._preprocess, InventoryPipelineConfig.PREPROCESS_CONCURRENCY, 1),
+            (self._analyze_batch if self.vision_batch_size > 1 else self._analyze,
+             InventoryPipelineConfig.ANALYSIS_CONCURRENCY, self.vision_batch_size),
+            (self._write, InventoryPipelineConfig.WRITE_CONCURRENCY, 1)
+        ]
+    
+    async def _lookup_catalog(self, urls: List[str]) -> None:
+        """Load the stored hash and ETag of every incoming URL already in products, in one query"""
+        rows = await self.pool.fetch(
+            'SELECT image_url, content_hash, source_etag FROM products WHERE image_url = ANY($1::text[])', urls
+        )
+        self.catalog = {row['image_url']: (row['content_hash'], row['source_etag']) for row in rows}
+    
+    async def _download(self, item: Dict[str, Any]) -> None:
+        known_hash, known_etag = self.catalog.get(item['url'], (None, None))
+        item['catalog'] = 'changed' if item['url'] in self.catalog else 'new'
+        data, item['etag'] = await http_client.fetch_if_changed(
+            item['url'], known_etag if known_hash and not self.force else None
+        )
+        if data is None:
+            item['catalog'] = 'unchanged'
+            item['skipped'] = True
+            return
+        item['data'] = data
+        item['content_hash'] = hashlib.sha256(item['data']).hexdigest()
+        if known_hash == item['content_hash']:
+            item['catalog'] = 'unchanged'
+            if not self.force:
+                item['skipped'] = True
+                item.pop('data')
+                if item['etag'] and item['etag'] != known_etag:
+                    self.stale_etags.append((item['url'], known_hash, item['etag']))
+                return
+        item['cache_key'] = AnalysisCache.make_key(
+            item['content_hash'], self.instruction, FileProcessor.IMAGE_PROMPT_VERSION, FileProcessor.IMAGE_MODEL
+        )
+    
+    async def _preprocess(self, item: Dict[str, Any]) -> None:
+        if not self.force:
+            cached = await image_analysis_cache.get(self.pool, item['cache_key'])
+            if cached is not None:
+                item.pop('data')
+                item['analysis'] = cached
+                item['cached'] = True
+                return
+        item['base64'], steps = await image_preprocessor.prepare(item.pop('data'))
+        for step, seconds in steps.items():
+            self._record_timing(f'preprocess.{step}', seconds)
+    
+    async def _analyze(self, item: Dict[str, Any]) -> None:
+        if item.get('cached'):
+            return
+        item['analysis'] = await FileProcessor.request_image_analysis(item.pop('base64'), self.instruction)
+        await image_analysis_cache.set(self.pool, item['cache_key'], item['analysis'])
+    
+    async def _analyze_batch(self, items: List[Dict[str, Any]]) -> None:
+        """Analyze several images in one request, falling back to single calls for any gaps"""
+        pending = [item for item in items if not item.get('cached')]
+        if not pending:
+            return
+        
+        results: List[Optional[dict]] = [None] * len(pending)
+        if len(pending) > 1:
+            try:
+                results = await FileProcessor.request_image_batch_analysis(
+                    [item['base64'] for item in pending], self.instruction
+                )
+            except Exception as e:
+                logger.warning(f"Batched analysis of {len(pending)} images failed, retrying individually: {e}")
+        
+        async def analyze_single(item: Dict[str, Any]) -> None:
+            try:
+                await self._analyze(item)
+            except Exception as e:
+                logger.error(f"Error processing image {item['name']} in analyze stage: {e}")
+                item['error'] = str(e)
+        
+        fallbacks = []
+        for item, result in zip(pending, results):
+            if result is None:
+                fallbacks.append(analyze_single(item))
+                continue
+            item.pop('base64', None)
+            item['analysis'] = result
+            await image_analysis_cache.set(self.pool, item['cache_key'], result)
+        if fallbacks:
+            if len(pending) > 1:
+                logger.info(f"Falling back to single-image analysis for {len(fallbacks)} of {len(pending)} images")
+            await asyncio.gather(*fallbacks)
+    
+    async def _write(self, item: Dict[str, Any]) -> None:
+        await self.buffer.add(FileProcessor.product_row(
+            item['url'], item['analysis'], item.get('content_hash'), item.get('etag')
+        ), item)
+    
+    def _record_timing(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.timed_items[name] = self.timed_items.get(name, 0) + 1
+    
+    def timing_summary(self) -> Dict[str, Dict[str, float]]:
+        """Total and mean milliseconds spent per stage"""
+        return {
+            name: {
+                'total_ms': round(1000 * total, 1),
+                'avg_ms': round(1000 * total / self.timed_items[name], 1)
+            }
+            for name, total in sorted(self.timings.items())
+        }
+    
+    def _on_flush(self, item: Dict[str, Any], error: Optional[Exception]) -> None:
+        if error is not None:
+            item['error'] = str(error)
+        self._finish(item)
+    
+    def _finish(self, item: Dict[str, Any]) -> None:
+        item.pop('data', None)
+        item.pop('base64', None)
+        if self.on_item_done:
+            self.on_item_done(item)
+    
+    async def run(self, images: List[Dict[str, str]]) -> None:
+        """Push every image through all stages and wait for the last write."""
+        queues = [asyncio.Queue(maxsize=max(1, InventoryPipelineConfig.QUEUE_SIZE)) for _ in self.stages]
+        
+        async def feed():
+            for position, image in enumerate(images):
+                await queues[0].put({
+                    'url': image['url'],
+                    'name': image.get('name', 'unknown'),
+                    'position': image.get('position', position)
+                })
+            for _ in range(max(1, self.stages[0][1])):
+                await queues[0].put(None)
+        
+        async def collect(inbox: asyncio.Queue, batch_size: int) -> Tuple[List[Dict[str, Any]], bool]:
+            """Next batch from inbox and whether the end-of-stream marker was reached"""
+            item = await inbox.get()
+            if item is None:
+                return [], True
+            batch = [item]
+            while len(batch) < batch_size:
+                try:
+                    item = await asyncio.wait_for(inbox.get(), timeout=InventoryPipelineConfig.VISION_BATCH_WAIT)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    return batch, True
+                batch.append(item)
+            return batch, False
+        
+        async def run_stage(index: int):
+            handler, concurrency, batch_size = self.stages[index]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            
+            async def worker():
+                stage_name = handler.__name__.strip('_').replace('_batch', '')
+                finished = False
+                while not finished:
+                    batch, finished = await collect(inbox, batch_size)
+                    if not batch:
+                        break
+                    started = time.perf_counter()
+                    if batch_size > 1:
+                        await handler(batch)
+                    else:
+                        try:
+                            await handler(batch[0])
+                        except Exception as e:
+                            logger.error(f"Error processing image {batch[0]['name']} in {stage_name} stage: {e}")
+                            batch[0]['error'] = str(e)
+                    self._record_timing(stage_name, time.perf_counter() - started)
+                    for item in batch:
+                        if 'error' in item or item.get('skipped'):
+                            self._finish(item)
+                        elif outbox is not None:
+                            await outbox.put(item)
+            
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+            if outbox is not None:
+                for _ in range(max(1, self.stages[index + 1][1])):
+                    await outbox.put(None)
+        
+        await self._lookup_catalog([image['url'] for image in images])
+        tasks = [asyncio.create_task(feed())]
+        tasks.extend(asyncio.create_task(run_stage(i)) for i in range(len(self.stages)))
+        try:
+            await asyncio.gather(*tasks)
+            if self.stale_etags:
+                await self.pool.executemany(
+                    'UPDATE products SET content_hash = $2, source_etag = $3 WHERE image_url = $1', self.stale_etags
+                )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            await self.buffer.close()
+
+class InventoryBatchPipeline(InventoryPipeline):
+    """InventoryPipeline that leaves the analysis to a BatchJob.
+    
+    run() downloads and preprocesses every image and adds one batch request
+    per image that is not already cached; cached images are written straight
+    away. Once the job has finished, ingest() stores its results through the
+    same product upsert and analysis cache as the interactive pipeline.
+    """
+    def __init__(self, instruction: str, pool: asyncpg.Pool, job: BatchJob,
+                 on_item_done: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 force: bool = False):
+        super().__init__(instruction, pool, on_item_done, force=force)
+        self.job = job
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.stages = self.stages[:2] + [(self._enqueue, 1, 1)]
+    
+    async def _enqueue(self, item: Dict[str, Any]) -> None:
+        if item.get('cached'):
+            await self._write(item)
+            return
+        # The job_items position, so a resumed job finds its results in batches already submitted
+        custom_id = f"image-{item['position']}"
+        self.job.add(custom_id, FileProcessor.image_request(item.pop('base64'), self.instruction))
+        self.pending[custom_id] = item
+    
+    async def ingest(self, results: Dict[str, Tuple[Optional[Dict[str, Any]], Optional[str]]]) -> None:
+        """Store the analysis of every image submitted to the batch"""
+        async with FileProcessor.product_buffer(self.pool, self._on_flush) as buffer:
+            for custom_id, item in self.pending.items():
+                body, error = results.get(custom_id, (None, 'No result returned by the batch'))
+                try:
+                    if body is None:
+                        raise Exception(error)
+                    item['analysis'] = FileProcessor.parse_image_response(body['choices'][0]['message']['content'])
+                except Exception as e:
+                    logger.error(f"Error processing image {item['name']} from batch: {e}")
+                    item['error'] = str(e)
+                    self._finish(item)
+                    continue
+                await image_analysis_cache.set(self.pool, item['cache_key'], item['analysis'])
+                await buffer.add(FileProcessor.product_row(
+                    item['url'], item['analysis'], item.get('content_hash'), item.get('etag')
+                ), item)
+        self.pending = {}
+
 # Auth routes
 @app.route('/api/auth/google', methods=['POST'])
 async def google_auth():
@@ -906,14 +3632,13 @@ async def google_auth():
             return jsonify({'success': False, 'message': 'Google token is required'}), 400
             
         # Verify Google token and get user info
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                'https://www.googleapis.com/oauth2/v3/userinfo',
-                headers={'Authorization': f'Bearer {google_token}'}
-            ) as resp:
-                if resp.status != 200:
-                    return jsonify({'success': False, 'message': 'Invalid Google token'}), 401
-                google_user = await resp.json()
+        async with http_client.session.get(
+            'https://www.googleapis.com/oauth2/v3/userinfo',
+            headers={'Authorization': f'Bearer {google_token}'}
+        ) as resp:
+            if resp.status != 200:
+                return jsonify({'success': False, 'message': 'Invalid Google token'}), 401
+            google_user = await resp.json()
         
         async with get_db_pool() as pool:
             async with pool.acquire() as conn:
@@ -1089,7 +3814,10 @@ app.route('/api/documents', methods=['GET'])(DocumentAPI.get_documents)
 app.route('/api/documents/<int:doc_id>/text', methods=['GET'])(DocumentAPI.get_document_text)
 app.route('/api/documents/<int:doc_id>/file', methods=['GET'])(DocumentAPI.get_document_file)
 app.route('/api/documents/search', methods=['POST'])(DocumentAPI.search_documents)
+app.route('/api/documents/metadata-search', methods=['GET'])(DocumentAPI.search_metadata)
+app.route('/api/documents/semantic-search', methods=['POST'])(DocumentAPI.semantic_search)
 app.route('/api/inventory', methods=['GET'])(InventoryAPI.get_inventory)
+app.route('/api/inventory/search', methods=['GET'])(InventoryAPI.search_inventory)
 
 @app.route('/api/process-inventory', methods=['POST'])
 async def process_inventory():
@@ -1104,6 +3832,8 @@ async def process_inventory():
         
         files = data['files']
         instruction = data.get('instruction', "Catalog, categorize and describe the inventory item.")
+        if data.get('mode', 'interactive') not in ('interactive', 'batch'):
+            return jsonify({'error': "mode must be 'interactive' or 'batch'"}), 400
         logger.info(f"Processing {len(files)} inventory items with instruction: {instruction}")
         
         # Validate files are images
@@ -1123,12 +3853,12 @@ async def process_inventory():
             logger.error("No valid image files provided")
             return jsonify({'error': 'No valid image files provided'}), 400
         
-        # Create task
+        # Create task and queue it for an ingest worker, interactive or through the Batch API
         task_id = str(uuid.uuid4())
-        task_manager.add_task(task_id)
-        
-        # Process images in batches
-        asyncio.create_task(process_inventory_async(image_files, instruction, task_id))
+        await task_manager.add_task(task_id)
+        kind = 'inventory_batch' if data.get('mode') == 'batch' else 'inventory'
+        await job_queue.enqueue(task_id, kind, image_files, instruction, {'force': bool(data.get('force', False))})
+        await task_manager.release(task_id)
         
         return jsonify({'status': 'success', 'task_id': task_id}), 202
         
@@ -1149,6 +3879,8 @@ async def process_documents():
         
         files = data['files']
         instruction = data.get('instruction', "Analyze and catalog the document.")
+        if data.get('mode', 'interactive') not in ('interactive', 'batch'):
+            return jsonify({'error': "mode must be 'interactive' or 'batch'"}), 400
         logger.info(f"Processing {len(files)} documents with instruction: {instruction}")
         
         # Validate files are documents
@@ -1168,95 +3900,126 @@ async def process_documents():
             logger.error("No valid document files provided")
             return jsonify({'error': 'No valid document files provided'}), 400
         
-        # Create task
+        # Create task and queue it for an ingest worker, interactive or through the Batch API
         task_id = str(uuid.uuid4())
-        task_manager.add_task(task_id)
-        
-        # Process documents
-        asyncio.create_task(process_documents_async(doc_files, instruction, task_id))
+        await task_manager.add_task(task_id)
+        kind = 'documents_batch' if data.get('mode') == 'batch' else 'documents'
+        await job_queue.enqueue(task_id, kind, doc_files, instruction)
+        await task_manager.release(task_id)
         return jsonify({'status': 'success', 'task_id': task_id}), 202
         
     except Exception as e:
         logger.error(f"Error processing documents: {e}")
         return jsonify({'error': str(e)}), 500
 
-async def process_inventory_async(images: List[Dict[str, str]], instruction: str, task_id: str) -> None:
-    """Process inventory images asynchronously in batches"""
-    task = task_manager.get_task(task_id)
+async def process_inventory_async(images: List[Dict[str, str]], instruction: str, task_id: str,
+                                  force: bool = False, checkpoint: Optional[Callable] = None
+                                  ) -> Optional[Dict[str, Any]]:
+    """Process inventory images asynchronously through the staged pipeline"""
+    task = await task_manager.get_task(task_id)
     if not task:
         logger.error(f"Task {task_id} not found, cancelling execution.")
         return
     
+    current_task_id.set(task_id)
     try:
         task_manager.update_task(task_id, status='processing', progress=10)
+        total_images = len(images)
+        counts = {'processed': 0, 'failed': 0, 'cached': 0, 'skipped': 0, 'changed': 0, 'new': 0, 'unchanged': 0}
+        
+        def on_item_done(item: Dict[str, Any]) -> None:
+            if 'error' in item:
+                counts['failed'] += 1
+                task_manager.update_task(task_id, error=f"Image {item['name']} failed: {item['error']}")
+            else:
+                counts['processed'] += 1
+                counts['cached'] += 1 if item.get('cached') else 0
+                counts['skipped' if item.get('skipped') else item.get('catalog', 'new')] += 1
+            if checkpoint:
+                checkpoint(item, item.get('error'))
+            done = counts['processed'] + counts['failed']
+            task_manager.update_task(
+                task_id,
+                progress=int(10 + (90 * done / total_images)),
+                message=f'Processed {done}/{total_images} images'
+            )
         
         async with get_db_pool() as pool:
-            async with pool.acquire() as conn:
-                total_images = len(images)
-                processed = 0
-                batch_size = 5  # Process 5 images at a time
-                
-                for i in range(0, total_images, batch_size):
-                    batch = images[i:i + batch_size]
-                    try:
-                        await FileProcessor.process_image_batch(batch, instruction, conn)
-                        processed += len(batch)
-                        progress = 10 + (90 * processed / total_images)
-                        task_manager.update_task(
-                            task_id, 
-                            progress=int(progress),
-                            message=f'Processed {processed}/{total_images} images'
-                        )
-                    except Exception as batch_error:
-                        logger.error(f"Error processing batch {i//batch_size + 1}: {batch_error}")
-                        task_manager.update_task(task_id, error=f"Batch {i//batch_size + 1} failed: {str(batch_error)}")
-                        continue
+            pipeline = InventoryPipeline(instruction, pool, on_item_done, force=force)
+            await pipeline.run(images)
         
+        timings = pipeline.timing_summary()
+        logger.info(f"Inventory task {task_id} stage timings: {timings}")
+        processed = counts['processed']
         final_status = 'completed' if processed == total_images else 'completed_with_errors'
-        task_manager.update_task(
-            task_id, 
+        return dict(
             status=final_status,
-            message=f'Processing complete! {processed}/{total_images} images processed successfully.',
-            progress=100
+            message=f'Processing complete! {processed}/{total_images} images processed successfully '
+                    f'({catalog_summary(counts)}).',
+            progress=100,
+            cached=counts['cached'],
+            skipped=counts['skipped'],
+            changed=counts['changed'],
+            new=counts['new'],
+            unchanged=counts['unchanged'],
+            timings=timings
         )
         
     except Exception as e:
         logger.error(f"Error in inventory processing task {task_id}: {e}")
-        task_manager.update_task(task_id, status='failed', message=f'Error: {str(e)}', progress=100)
+        return dict(status='failed', message=f'Error: {str(e)}', progress=100)
+
+async def index_document_embeddings(pool: asyncpg.Pool, documents: List[Dict[str, str]], task_id: str) -> None:
+    """Embed a job's stored documents for semantic search; failures only cost search coverage"""
+    try:
+        await document_embeddings.index_documents(pool, [doc['url'] for doc in documents])
+    except Exception as e:
+        logger.error(f"Error embedding documents for task {task_id}: {e}")
 
-async def process_documents_async(documents: List[Dict[str, str]], instruction: str, task_id: str) -> None:
+async def process_documents_async(documents: List[Dict[str, str]], instruction: str, task_id: str,
+                                  checkpoint: Optional[Callable] = None) -> Optional[Dict[str, Any]]:
     """Process documents asynchronously with improved error handling"""
-    task = task_manager.get_task(task_id)
+    task = await task_manager.get_task(task_id)
     if not task:
         logger.error(f"Task {task_id} not found, cancelling execution.")
         return
     
+    current_task_id.set(task_id)
     try:
         task_manager.update_task(task_id, status='processing', progress=10)
         
+        total_docs = len(documents)
+        counts = {'processed': 0, 'failed': 0}
+        
+        def on_document_done(doc: Dict[str, str], error: Optional[Exception]) -> None:
+            if error is not None:
+                counts['failed'] += 1
+                task_manager.update_task(task_id, error=f"Document {doc['name']} failed: {str(error)}")
+            else:
+                counts['processed'] += 1
+            if checkpoint:
+                checkpoint(doc, None if error is None else str(error))
+            done = counts['processed'] + counts['failed']
+            task_manager.update_task(
+                task_id, 
+                progress=int(10 + (90 * done / total_docs)),
+                message=f'Processed {done}/{total_docs} documents'
+            )
+        
         async with get_db_pool() as pool:
-            async with pool.acquire() as conn:
-                total_docs = len(documents)
-                processed = 0
-                
+            async with FileProcessor.document_buffer(pool, on_document_done) as buffer:
                 for doc in documents:
                     try:
-                        await FileProcessor.process_document(doc, instruction, conn)
-                        processed += 1
-                        progress = 10 + (90 * processed / total_docs)
-                        task_manager.update_task(
-                            task_id, 
-                            progress=int(progress),
-                            message=f'Processed {processed}/{total_docs} documents'
-                        )
+                        await FileProcessor.process_document(doc, instruction, buffer)
                     except Exception as doc_error:
-                        logger.error(f"Error processing document {doc['name']}: {doc_error}")
-                        task_manager.update_task(task_id, error=f"Document {doc['name']} failed: {str(doc_error)}")
-                        continue
+                        on_document_done(doc, doc_error)
+            
+            # Embed once the buffer has flushed, so every stored document has its id
+            await index_document_embeddings(pool, documents, task_id)
         
+        processed = counts['processed']
         final_status = 'completed' if processed == total_docs else 'completed_with_errors'
-        task_manager.update_task(
-            task_id, 
+        return dict(
             status=final_status,
             message=f'Processing complete! {processed}/{total_docs} documents processed successfully.',
             progress=100
@@ -1264,21 +4027,621 @@ async def process_documents_async(documents: List[Dict[str, str]], instruction:
         
     except Exception as e:
         logger.error(f"Error in document processing task {task_id}: {e}")
-        task_manager.update_task(task_id, status='failed', message=f'Error: {str(e)}', progress=100)
+        return dict(status='failed', message=f'Error: {str(e)}', progress=100)
+
+def catalog_summary(counts: Dict[str, int]) -> str:
+    """How many images were new, changed or unchanged, for the final task message"""
+    parts = [f"{counts['new']} new", f"{counts['changed']} changed"]
+    if counts['unchanged']:
+        parts.append(f"{counts['unchanged']} unchanged but re-analyzed")
+    parts.append(f"{counts['skipped']} unchanged and skipped")
+    return ', '.join(parts)
+
+def batch_progress(task_id: str, noun: str, start: int = 30, end: int = 90) -> Callable[[int, int, int], None]:
+    """on_progress callback for BatchJob.run mapping batch counts onto start-end% of the task"""
+    def on_progress(completed: int, failed: int, total: int) -> None:
+        # A resumed job counts only its pending requests, while the batches report every request
+        done = min(completed + failed, total)
+        task_manager.update_task(
+            task_id,
+            progress=int(start + ((end - start) * done / max(total, 1))),
+            message=f'Batch API finished {done}/{total} {noun} requests'
+        )
+    return on_progress
+
+async def process_inventory_batch_async(images: List[Dict[str, str]], instruction: str, task_id: str,
+                                        force: bool = False, checkpoint: Optional[Callable] = None,
+                                        batches: Optional[BatchLedger] = None) -> Optional[Dict[str, Any]]:
+    """Process inventory images through the OpenAI Batch API"""
+    task = await task_manager.get_task(task_id)
+    if not task:
+        logger.error(f"Task {task_id} not found, cancelling execution.")
+        return
+    
+    current_task_id.set(task_id)
+    job = BatchJob(task_id, ledger=batches)
+    try:
+        task_manager.update_task(task_id, status='processing', progress=5, mode='batch',
+                                 message='Preparing batch requests')
+        total_images = len(images)
+        counts = {'processed': 0, 'failed': 0, 'cached': 0, 'skipped': 0, 'changed': 0, 'new': 0, 'unchanged': 0}
+        
+        def on_item_done(item: Dict[str, Any]) -> None:
+            if 'error' in item:
+                counts['failed'] += 1
+                task_manager.update_task(task_id, error=f"Image {item['name']} failed: {item['error']}")
+            else:
+                counts['processed'] += 1
+                counts['cached'] += 1 if item.get('cached') else 0
+                counts['skipped' if item.get('skipped') else item.get('catalog', 'new')] += 1
+            if checkpoint:
+                checkpoint(item, item.get('error'))
+        
+        async with get_db_pool() as pool:
+            pipeline = InventoryBatchPipeline(instruction, pool, job, on_item_done, force=force)
+            await pipeline.run(images)
+            
+            if job.count:
+                task_manager.update_task(task_id, progress=30, batch_requests=job.count,
+                                         message=f'Waiting on {job.count} images already submitted to the Batch API'
+                                         if job.submitted is not None else f'Submitted {job.count} images to the Batch API')
+                results = await job.run(batch_progress(task_id, 'image'))
+                task_manager.update_task(task_id, progress=90, message='Storing batch results')
+                await pipeline.ingest(results)
+        
+        processed = counts['processed']
+        final_status = 'completed' if processed == total_images else 'completed_with_errors'
+        return dict(
+            status=final_status,
+            message=f'Processing complete! {processed}/{total_images} images processed successfully '
+                    f'({catalog_summary(counts)}).',
+            progress=100,
+            cached=counts['cached'],
+            skipped=counts['skipped'],
+            changed=counts['changed'],
+            new=counts['new'],
+            unchanged=counts['unchanged']
+        )
+        
+    except Exception as e:
+        logger.error(f"Error in inventory batch task {task_id}: {e}")
+        return dict(status='failed', message=f'Error: {str(e)}', progress=100)
+    finally:
+        job.discard()
+
+async def process_documents_batch_async(documents: List[Dict[str, str]], instruction: str, task_id: str,
+                                        checkpoint: Optional[Callable] = None,
+                                        batches: Optional[BatchLedger] = None) -> Optional[Dict[str, Any]]:
+    """Process documents through the OpenAI Batch API.
+    
+    Short documents need one request. Long ones go through two batches: the
+    first takes notes on each section, the second combines them, mirroring
+    request_document_analysis. While the batches run, only each document's
+    metadata stays in memory; its extracted text waits in a spill file until
+    its result is stored.
+    """
+    task = await task_manager.get_task(task_id)
+    if not task:
+        logger.error(f"Task {task_id} not found, cancelling execution.")
+        return
+    
+    current_task_id.set(task_id)
+    jobs = [BatchJob(task_id, ledger=batches, stage='analysis'),
+            BatchJob(task_id, ledger=batches, stage='reduce')]
+    texts_fd, texts_path = tempfile.mkstemp(dir=PATHS['BATCH_DIR'], prefix=f"{task_id}-texts-", suffix='.txt')
+    texts = os.fdopen(texts_fd, 'w+b')
+    
+    def spill_text(text: str) -> Tuple[int, int]:
+        data = text.encode('utf-8')
+        offset = texts.seek(0, os.SEEK_END)
+        texts.write(data)
+        return offset, len(data)
+    
+    def read_text(entry: Dict[str, Any]) -> str:
+        texts.seek(entry['text_offset'])
+        return texts.read(entry['text_length']).decode('utf-8')
+    
+    try:
+        task_manager.update_task(task_id, status='processing', progress=5, mode='batch',
+                                 message='Preparing batch requests')
+        total_docs = len(documents)
+        counts = {'processed': 0, 'failed': 0}
+        
+        def on_document_done(doc: Dict[str, str], error: Optional[Exception]) -> None:
+            if error is not None:
+                counts['failed'] += 1
+                task_manager.update_task(task_id, error=f"Document {doc['name']} failed: {str(error)}")
+            else:
+                counts['processed'] += 1
+            if checkpoint:
+                checkpoint(doc, None if error is None else str(error))
+        
+        def response_json(outcome: Tuple[Optional[Dict[str, Any]], Optional[str]]) -> Dict[str, Any]:
+            body, error = outcome
+            if body is None:
+                raise Exception(error)
+            return json.loads(body['choices'][0]['message']['content'])
+        
+        async with get_db_pool() as pool:
+            async with FileProcessor.document_buffer(pool, on_document_done) as buffer:
+                
+                async def store(entry: Dict[str, Any], doc_info: Dict[str, Any]) -> None:
+                    await document_analysis_cache.set(pool, document_cache_key(entry['content_hash']), doc_info)
+                    await buffer.add(FileProcessor.document_row(
+                        entry['doc'], doc_info, read_text(entry), entry['page_count'], entry['content_hash']
+                    ), entry['doc'])
+                
+                # job_items position -> document awaiting the batch; positions keep custom_ids stable across resumes
+                pending: Dict[int, Dict[str, Any]] = {}
+                for index, doc in enumerate(documents):
+                    position = doc.get('position', index)
+                    try:
+                        file_ext = os.path.splitext(doc['name'])[1].lower()
+                        if not extraction_engine.supports(file_ext):
+                            raise ValueError(f"Unsupported file type: {file_ext}")
+                        async with http_client.download_to_file(doc['url'], suffix=file_ext) as file_path:
+                            extracted = await extraction_engine.extract(file_path, file_ext)
+                        text = extracted['text']
+                        entry = {
+                            'doc': doc,
+                            'page_count': extracted['page_count'],
+                            'content_hash': document_content_hash(text)
+                        }
+                        doc_info = await lookup_document_analysis(pool, entry['content_hash'])
+                        if doc_info is not None:
+                            await buffer.add(FileProcessor.document_row(
+                                doc, doc_info, text, entry['page_count'], entry['content_hash']
+                            ), doc)
+                            continue
+                        
+                        chunks = document_sections(text)
+                        if chunks is None:
+                            jobs[0].add(f"doc-{position}", json_completion_body(
+                                DOCUMENT_MODEL, document_analysis_messages(text), 1600
+                            ))
+                        else:
+                            entry['sections'] = len(chunks)
+                            for section, chunk in enumerate(chunks):
+                                jobs[0].add(f"doc-{position}-section-{section}", json_completion_body(
+                                    DOCUMENT_MODEL, document_section_messages(section, len(chunks), chunk), 800
+                                ))
+                        entry['text_offset'], entry['text_length'] = spill_text(text)
+                        pending[position] = entry
+                    except Exception as doc_error:
+                        logger.error(f"Error processing document {doc['name']}: {doc_error}")
+                        on_document_done(doc, doc_error)
+                    task_manager.update_task(
+                        task_id,
+                        progress=int(5 + (25 * (index + 1) / total_docs)),
+                        message=f'Prepared {index + 1}/{total_docs} documents'
+                    )
+                
+                if jobs[0].count:
+                    task_manager.update_task(task_id, progress=30, batch_requests=jobs[0].count,
+                                             message=f'Submitted {jobs[0].count} document requests to the Batch API')
+                    two_rounds = any('sections' in entry for entry in pending.values())
+                    results = await jobs[0].run(batch_progress(task_id, 'document', end=70 if two_rounds else 90))
+                    
+                    reducing: Dict[int, Dict[str, Any]] = {}
+                    for position, entry in pending.items():
+                        if 'sections' not in entry:
+                            try:
+                                doc_info = response_json(results.get(f"doc-{position}", (None, 'No result returned by the batch')))
+                            except Exception as e:
+                                logger.error(f"Error analyzing document {entry['doc']['name']} from batch: {e}")
+                                on_document_done(entry['doc'], e)
+                                continue
+                            await store(entry, doc_info)
+                            continue
+                        
+                        sections = []
+                        for section in range(entry['sections']):
+                            try:
+                                notes = response_json(results.get(
+                                    f"doc-{position}-section-{section}", (None, 'No result returned by the batch')
+                                ))
+                                sections.append({'section': section + 1, **notes})
+                            except Exception as e:
+                                logger.warning(f"Section {section + 1}/{entry['sections']} of {entry['doc']['name']} failed: {e}")
+                        if not sections:
+                            logger.error(f"Every section of {entry['doc']['name']} failed to analyze")
+                            on_document_done(entry['doc'], Exception("Every document section failed to analyze"))
+                            continue
+                        jobs[1].add(f"doc-{position}", json_completion_body(
+                            DOCUMENT_MODEL, document_reduce_messages(sections), 1600
+                        ))
+                        reducing[position] = entry
+                    
+                    if jobs[1].count:
+                        task_manager.update_task(task_id, message=f'Combining {jobs[1].count} long documents')
+                        results = await jobs[1].run(batch_progress(task_id, 'document', start=70))
+                        for position, entry in reducing.items():
+                            try:
+                                doc_info = response_json(results.get(f"doc-{position}", (None, 'No result returned by the batch')))
+                            except Exception as e:
+                                logger.error(f"Error analyzing document {entry['doc']['name']} from batch: {e}")
+                                on_document_done(entry['doc'], e)
+                                continue
+                            await store(entry, doc_info)
+                    task_manager.update_task(task_id, progress=90, message='Storing batch results')
+            
+            # Embed once the buffer has flushed, so every stored document has its id
+            await index_document_embeddings(pool, documents, task_id)
+        
+        processed = counts['processed']
+        final_status = 'completed' if processed == total_docs else 'completed_with_errors'
+        return dict(
+            status=final_status,
+            message=f'Processing complete! {processed}/{total_docs} documents processed successfully.',
+            progress=100
+        )
+        
+    except Exception as e:
+        logger.error(f"Error in document batch task {task_id}: {e}")
+        return dict(status='failed', message=f'Error: {str(e)}', progress=100)
+    finally:
+        for job in jobs:
+            job.discard()
+        texts.close()
+        Path(texts_path).unlink(missing_ok=True)
+
+class JobQueueConfig:
+    """Durable ingest queue settings"""
+    # Seconds a claimed job stays hidden from other workers without a heartbeat
+    VISIBILITY_TIMEOUT = float(os.getenv('JOB_VISIBILITY_TIMEOUT', '300'))
+    # Seconds between lease renewals and item checkpoints of a running job
+    HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', '30'))
+    # Seconds an idle worker waits before looking for work again
+    POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '2'))
+    # Claims of one job before it is given up as failed
+    MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    # Job runners the web process starts itself; 0 leaves all ingest to worker.py
+    INLINE_WORKERS = int(os.getenv('JOB_INLINE_WORKERS', '0'))
+
+class JobQueue:
+    """Postgres-backed queue of ingest jobs.
+    
+    Routes enqueue a job with one job_items row per file; workers claim jobs
+    with FOR UPDATE SKIP LOCKED and hold them under a lease renewed every
+    JOB_HEARTBEAT_INTERVAL. Finished items are checkpointed with each renewal,
+    so a job whose worker died is picked up again after JOB_VISIBILITY_TIMEOUT
+    and resumes with only its pending items.
+    """
+    def __init__(self):
+        # kind -> job function taking (items, instruction, task_id, checkpoint=..., **options) and
+        # returning the task's final status, message and counts for run_job to publish with the items
+        self.handlers: Dict[str, Callable[..., Awaitable[None]]] = {}
+        # Kinds whose job function also takes batches=BatchLedger to resume submitted batches
+        self.batch_kinds: set = set()
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._runners: List[asyncio.Task] = []
+    
+    async def enqueue(self, job_id: str, kind: str, items: List[Dict[str, str]], instruction: str,
+                      options: Optional[Dict[str, Any]] = None) -> None:
+        async with get_db_pool() as pool:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        'INSERT INTO jobs (job_id, kind, instruction, options) VALUES ($1, $2, $3, $4::jsonb)',
+                        job_id, kind, instruction, json.dumps(options or {})
+                    )
+                    await conn.executemany(
+                        'INSERT INTO job_items (job_id, position, url, name) VALUES ($1, $2, $3, $4)',
+                        [(job_id, position, item['url'], item.get('name')) for position, item in enumerate(items)]
+                    )
+    
+    async def claim(self, pool: asyncpg.Pool) -> Optional[asyncpg.Record]:
+        """Lease the oldest queued job, or a running one whose lease has expired"""
+        return await pool.fetchrow("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = $1,
+                locked_until = now() + make_interval(secs => $2), updated_at = now()
+            WHERE job_id = (
+                SELECT job_id FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND locked_until < now())
+                ORDER BY created_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING job_id, kind, instruction, options, batches, attempts
+        """, self.worker_id, JobQueueConfig.VISIBILITY_TIMEOUT)
+    
+    async def renew(self, pool: asyncpg.Pool, job_id: str) -> bool:
+        """Extend this worker's lease; False once another worker has taken the job over"""
+        result = await pool.execute("""
+            UPDATE jobs SET locked_until = now() + make_interval(secs => $3), updated_at = now()
+            WHERE job_id = $1 AND locked_by = $2 AND status = 'running'
+        """, job_id, self.worker_id, JobQueueConfig.VISIBILITY_TIMEOUT)
+        return result.split()[-1] != '0'
+    
+    async def checkpoint(self, pool: asyncpg.Pool, job_id: str, outcomes: List[Tuple[int, Optional[str]]]) -> None:
+        """Mark items, by position, done or failed; they are skipped if the job is claimed again"""
+        await pool.executemany("""
+            UPDATE job_items SET status = CASE WHEN $3::text IS NULL THEN 'done' ELSE 'failed' END,
+                error = $3, updated_at = now()
+            WHERE job_id = $1 AND position = $2 AND status = 'pending'
+        """, [(job_id, position, error) for position, error in outcomes])
+    
+    async def finish(self, pool: asyncpg.Pool, job_id: str, status: str) -> None:
+        await pool.execute("""
+            UPDATE jobs SET status = $3, locked_by = NULL, locked_until = NULL, updated_at = now()
+            WHERE job_id = $1 AND locked_by = $2
+        """, job_id, self.worker_id, status)
+    
+    async def requeue(self, pool: asyncpg.Pool, job_id: str) -> None:
+        """Hand a job back right away, without spending an attempt, when this worker shuts down"""
+        await pool.execute("""
+            UPDATE jobs SET status = 'queued', attempts = attempts - 1, locked_by = NULL,
+                locked_until = NULL, updated_at = now()
+            WHERE job_id = $1 AND locked_by = $2
+        """, job_id, self.worker_id)
+    
+    async def item_outcomes(self, pool: asyncpg.Pool, job_id: str) -> List[Dict[str, Any]]:
+        """Outcome of every file in a job; files the job never reached are reported as skipped"""
+        rows = await pool.fetch(
+            'SELECT name, url, status, error FROM job_items WHERE job_id = $1 ORDER BY position', job_id
+        )
+        return [{
+            'name': row['name'],
+            'url': row['url'],
+            'status': 'skipped' if row['status'] == 'pending' else row['status'],
+            **({'error': row['error']} if row['error'] else {})
+        } for row in rows]
+    
+    async def retry(self, pool: asyncpg.Pool, job_id: str) -> Optional[int]:
+        """Queue a finished job again for its failed and skipped files only.
+        
+        Returns how many files were re-queued, or None if the job is unknown or
+        still queued or running.
+        """
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                status = await conn.fetchval('SELECT status FROM jobs WHERE job_id = $1 FOR UPDATE', job_id)
+                if status not in ('done', 'failed'):
+                    return None
+                result = await conn.execute("""
+                    UPDATE job_items SET status = 'pending', error = NULL, updated_at = now()
+                    WHERE job_id = $1 AND status IN ('failed', 'pending')
+                """, job_id)
+                count = int(result.split()[-1])
+                if count:
+                    await conn.execute("""
+                        UPDATE jobs SET status = 'queued', attempts = 0, batches = '{}', locked_by = NULL,
+                            locked_until = NULL, updated_at = now()
+                        WHERE job_id = $1
+                    """, job_id)
+                return count
+    
+    async def delete_expired(self, pool: asyncpg.Pool, ttl_seconds: int) -> int:
+        result = await pool.execute("""
+            DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < now() - make_interval(secs => $1)
+        """, float(ttl_seconds))
+        return int(result.split()[-1])
+    
+    async def run_job(self, pool: asyncpg.Pool, job: asyncpg.Record) -> None:
+        """Run a claimed job over its pending items, renewing the lease until it returns"""
+        job_id = job['job_id']
+        await task_manager.adopt(job_id)
+        if job['attempts'] > JobQueueConfig.MAX_ATTEMPTS:
+            logger.error(f"Job {job_id} abandoned after {job['attempts'] - 1} attempts")
+            task_manager.update_task(job_id, status='failed', progress=100,
+                                     message='Error: processing was interrupted too many times',
+                                     items=await self.item_outcomes(pool, job_id))
+            await self.finish(pool, job_id, 'failed')
+            await task_manager.release(job_id)
+            return
+        
+        rows = await pool.fetch(
+            "SELECT position, url, name FROM job_items WHERE job_id = $1 AND status = 'pending' ORDER BY position", job_id
+        )
+        items = [{'url': row['url'], 'name': row['name'] or 'unknown', 'position': row['position']} for row in rows]
+        if job['attempts'] > 1:
+            logger.info(f"Resuming job {job_id} with {len(items)} pending items")
+            task_manager.update_task(job_id, message=f'Resuming with {len(items)} files left')
+        
+        outcomes: List[Tuple[int, Optional[str]]] = []
+        
+        async def save_outcomes() -> None:
+            if outcomes:
+                batch = outcomes[:]
+                del outcomes[:len(batch)]
+                await self.checkpoint(pool, job_id, batch)
+        
+        options = json.loads(job['options'])
+        if job['kind'] in self.batch_kinds:
+            options['batches'] = BatchLedger(pool, job_id, json.loads(job['batches']))
+        handler = asyncio.create_task(self.handlers[job['kind']](
+            items, job['instruction'], job_id,
+            checkpoint=lambda item, error: outcomes.append((item['position'], error)),
+            **options
+        ))
+        lease_lost = False
+        try:
+            while not handler.done():
+                await asyncio.wait({handler}, timeout=JobQueueConfig.HEARTBEAT_INTERVAL)
+                try:
+                    await save_outcomes()
+                    if not handler.done() and not await self.renew(pool, job_id):
+                        logger.warning(f"Lease on job {job_id} was lost, stopping it here")
+                        lease_lost = True
+                        handler.cancel()
+                except Exception as e:
+                    logger.error(f"Error checkpointing job {job_id}: {e}")
+            
+            if lease_lost:
+                return
+            final = {'progress': 100, **(handler.result() or {})}
+            await save_outcomes()
+            outcomes_by_item = await self.item_outcomes(pool, job_id)
+            failed = final.get('status') == 'failed'
+            if not failed:
+                done = sum(1 for item in outcomes_by_item if item['status'] == 'done')
+                final['status'] = 'completed' if done == len(outcomes_by_item) else 'completed_with_errors'
+                if len(items) < len(outcomes_by_item) or 'message' not in final:
+                    # Resumed or retried: report on the whole job, not just this run's files
+                    final['message'] = f'Processing complete! {done}/{len(outcomes_by_item)} files processed successfully.'
+            # One terminal update, so watchers that stop at it still get the items
+            task_manager.update_task(job_id, items=outcomes_by_item, **final)
+            await self.finish(pool, job_id, 'failed' if failed else 'done')
+        except asyncio.CancelledError:
+            handler.cancel()
+            with suppress(BaseException):
+                await handler
+            with suppress(Exception):
+                await save_outcomes()
+                await self.requeue(pool, job_id)
+            task_manager.update_task(job_id, status='queued', message='Waiting for a worker')
+            raise
+        finally:
+            await task_manager.release(job_id)
+    
+    async def work(self) -> None:
+        """Claim and run jobs one at a time until cancelled"""
+        while True:
+            try:
+                async with get_db_pool() as pool:
+                    job = await self.claim(pool)
+                    if job is not None:
+                        await self.run_job(pool, job)
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {self.worker_id} error: {e}")
+            await asyncio.sleep(JobQueueConfig.POLL_INTERVAL)
+    
+    def start(self, concurrency: int) -> None:
+        """Run up to ``concurrency`` jobs at once in this process"""
+        while len(self._runners) < concurrency:
+            self._runners.append(asyncio.create_task(self.work()))
+    
+    async def close(self) -> None:
+        """Stop the runners; unfinished jobs go back to the queue"""
+        runners, self._runners = self._runners, []
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+
+job_queue = JobQueue()
+job_queue.handlers.update({
+    'inventory': process_inventory_async,
+    'inventory_batch': process_inventory_batch_async,
+    'documents': process_documents_async,
+    'documents_batch': process_documents_batch_async
+})
+job_queue.batch_kinds.update(('inventory_batch', 'documents_batch'))
+
+@app.route('/api/metrics', methods=['GET'])
+async def get_metrics():
+    """Runtime counters for this worker process."""
+    return jsonify({
+        'http': http_client.metrics.snapshot(),
+        'openai': openai_scheduler.snapshot(),
+        'analysis_cache': {
+            'image': image_analysis_cache.snapshot(),
+            'document': document_analysis_cache.snapshot()
+        }
+    })
 
 @app.route('/processing-status/<task_id>', methods=['GET'])
 async def processing_status(task_id: str):
     """Check the status of a background task."""
-    task = task_manager.get_task(task_id)
+    task = await task_manager.get_task(task_id)
     if not task:
         return jsonify({'error': 'Invalid task ID'}), 404
     return jsonify(task)
 
+@app.route('/api/tasks/<task_id>/events', methods=['GET'])
+async def task_events(task_id: str):
+    """Server-Sent Events stream of a background task's progress.
+    
+    Sends a 'progress' event with the full task state on every (coalesced)
+    change and an 'end' event once the task has finished.
+    """
+    if not await task_manager.get_task(task_id):
+        return jsonify({'error': 'Invalid task ID'}), 404
+    
+    async def stream():
+        async for task in task_manager.watch(task_id):
+            if task is None:
+                yield b': keep-alive\n\n'
+            else:
+                yield f"event: progress\ndata: {json.dumps(task, default=str)}\n\n".encode('utf-8')
+        yield b'event: end\ndata: {}\n\n'
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.timeout = None
+    return response
+
+@app.route('/api/tasks/<task_id>/retry', methods=['POST'])
+async def retry_task(task_id: str):
+    """Re-queue only the failed and skipped files of a finished task"""
+    try:
+        task = await task_manager.get_task(task_id)
+        if not task:
+            return jsonify({'error': 'Invalid task ID'}), 404
+        if task.get('status') not in TaskStoreConfig.TERMINAL_STATUSES:
+            return jsonify({'error': 'Task is still running'}), 409
+        
+        # Reset the task before the job is queued again, so the worker that claims it adopts the reset state
+        retrying = sum(1 for item in task.get('items', []) if item.get('status') != 'done')
+        await task_manager.adopt(task_id)
+        task_manager.update_task(
+            task_id,
+            status='queued',
+            progress=0,
+            message=f'Retrying {retrying} failed file{"s" if retrying != 1 else ""}' if retrying else 'Retrying failed files',
+            error=None,
+            retries=task.get('retries', 0) + 1
+        )
+        await task_manager.release(task_id)
+        
+        count = None
+        try:
+            async with get_db_pool() as pool:
+                count = await job_queue.retry(pool, task_id)
+        finally:
+            if not count:
+                await task_manager.adopt(task_id)
+                task_manager.update_task(task_id, **{**task, 'error': task.get('error'), 'retries': task.get('retries', 0)})
+                await task_manager.release(task_id)
+        if count is None:
+            return jsonify({'error': 'Task cannot be retried'}), 409
+        if count == 0:
+            return jsonify({'error': 'Task has no failed files to retry'}), 409
+        
+        return jsonify({'status': 'success', 'task_id': task_id, 'retrying': count}), 202
+    except Exception as e:
+        logger.error(f"Error retrying task {task_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.websocket('/ws/tasks/<task_id>')
+async def task_socket(task_id: str):
+    """WebSocket variant of task_events: one JSON message per update, closed when the task ends."""
+    if not await task_manager.get_task(task_id):
+        await websocket.close(1008, 'Invalid task ID')
+        return
+    await websocket.accept()
+    async for task in task_manager.watch(task_id):
+        await websocket.send(json.dumps({'type': 'keep-alive'} if task is None else {'type': 'progress', 'task': task}, default=str))
+    await websocket.send(json.dumps({'type': 'end'}))
+    await websocket.close(1000)
+
 @app.before_serving
 async def setup_task_cleanup():
     """Periodic cleanup of expired tasks."""
     async def cleanup_loop():
         while True:
             await asyncio.sleep(3600)
-            task_manager.cleanup()
+            await task_manager.cleanup()
+            try:
+                async with get_db_pool() as pool:
+                    await job_queue.delete_expired(pool, task_manager.ttl_seconds)
+                    for cache in (image_analysis_cache, document_analysis_cache):
+                        removed = await cache.evict(pool)
+                        if removed:
+                            logger.info(f"Evicted {removed} {cache.namespace} analysis cache entries")
+            except Exception as e:
+                logger.error(f"Analysis cache eviction failed: {e}")
     asyncio.create_task(cleanup_loop())
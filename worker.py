@@ -0,0 +1,85 @@
+"""Ingest worker entry point.
+
+Runs queued inventory and document jobs outside the web process:
+
+    python worker.py --processes 2 --concurrency 1
+
+Every process claims jobs from the Postgres queue on its own, so workers can be
+added or stopped at any time. A worker stopped with SIGTERM hands its running
+jobs back to the queue, and the next worker resumes them from their last
+checkpoint.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+
+async def run(concurrency: int) -> None:
+    """Run job runners in this process until SIGTERM or SIGINT"""
+    # Imported here rather than at module level: spawned extraction workers re-import
+    # this module as their main module and must not build the whole app
+    import server
+    logger = server.logger
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    pool = await server.db_pool_manager.open()
+    # The web process owns the schema; wait for it, then pick up the optional features it set up
+    while not await server.detect_database_features(pool):
+        logger.info("Waiting for the web process to create the database schema")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+        if stop.is_set():
+            await server.shutdown()
+            return
+    server.task_manager.start()
+    server.job_queue.start(concurrency)
+    logger.info(f"Ingest worker {server.job_queue.worker_id} running {concurrency} job(s) at a time")
+    try:
+        await stop.wait()
+    finally:
+        logger.info(f"Ingest worker {server.job_queue.worker_id} shutting down")
+        await server.shutdown()
+
+def run_process(concurrency: int) -> None:
+    asyncio.run(run(concurrency))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run queued ingest jobs')
+    parser.add_argument('--processes', type=int, default=int(os.getenv('JOB_WORKER_PROCESSES', '1')),
+                        help='worker processes to start; count them in OPENAI_SCHEDULER_PROCESSES, '
+                             'since each process rate-limits OpenAI calls on its own')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('JOB_WORKER_CONCURRENCY', '1')),
+                        help='jobs each process runs at once')
+    args = parser.parse_args()
+    
+    if args.processes <= 1:
+        run_process(args.concurrency)
+        return
+    
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_process, args=(args.concurrency,), name=f'ingest-worker-{i}')
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+if __name__ == '__main__':
+    main()